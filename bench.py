@@ -0,0 +1,1181 @@
+"""Benchmarks for the MIDI controller.
+
+Run with `python bench.py <benchmark> [options]`, see `python bench.py -h`.
+Qt benchmarks use the offscreen platform unless QT_QPA_PLATFORM is set.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+FRAME_BUDGET_MS = 1000 / 60
+
+
+def report(name, samples_ms, budget_ms=None):
+    """Print the distribution of a list of timings in milliseconds"""
+    samples_ms = sorted(samples_ms)
+    p99 = samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.99))]
+    line = (
+        f"{name:<32} mean {statistics.mean(samples_ms):8.3f} ms"
+        f"  median {statistics.median(samples_ms):8.3f} ms"
+        f"  p99 {p99:8.3f} ms  max {samples_ms[-1]:8.3f} ms"
+    )
+    if budget_ms is not None:
+        line += "  OK" if p99 <= budget_ms else f"  OVER {budget_ms:.1f} ms BUDGET"
+    print(line)
+
+
+def fake_engine(pads=8, buttons=None, midi_out=None):
+    """A routing engine with note outputs on every pad and a fake output port"""
+    from config_schema import compile_config
+    from mapping_store import MappingStore
+    from midi_backend import FakeMidiOut
+    from midi_engine import MidiEngine
+    from midi_router import MidiRouter
+    from pad_state import PadState
+
+    config = {
+        "buttons": buttons
+        or {
+            f"Button {i+1}": {
+                "input_type": "note",
+                "input_number": i,
+                "output_type": "note",
+                "output_number": 36 + i,
+            }
+            for i in range(pads)
+        }
+    }
+    store = MappingStore(pads)
+    store.load(compile_config(config))
+    if midi_out is None:
+        midi_out = FakeMidiOut()
+        midi_out.open_port()
+    engine = MidiEngine(midi_out, MidiRouter(PadState(pads)))
+    engine.router.load(store.inputs, store.outputs, store.pads, store.gestures)
+    engine.set_ports("Fake In", "Fake Out")
+    return engine
+
+
+def qt_app():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication(sys.argv[:1])
+
+
+def time_renders(widget, regions, frames):
+    """Render the widget into an image once per frame, cycling through regions"""
+    from PySide6.QtCore import QPoint
+    from PySide6.QtGui import QImage, QRegion
+
+    image = QImage(widget.size(), QImage.Format_RGB32)
+    samples = []
+    for frame in range(frames):
+        region = QRegion(regions[frame % len(regions)])
+        start = time.perf_counter()
+        widget.render(image, QPoint(), region)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_repaint(args):
+    """Full and single-pad repaint times of the painted grid vs styled buttons"""
+    app = qt_app()
+    from PySide6.QtWidgets import QGridLayout, QPushButton, QSizePolicy, QWidget
+
+    from pad_grid import PAD_COLORS, PadGrid
+
+    columns = 8 if args.pads > 8 else 4
+
+    grid = PadGrid(args.pads, columns)
+    grid.resize(args.width, args.height)
+    grid.layout_pads()
+    for i in range(args.pads):
+        grid.set_value(i, (i * 17) % 128)
+    app.processEvents()
+
+    full = [grid.rect()]
+    report("painted grid, full frame", time_renders(grid, full, args.frames), FRAME_BUDGET_MS)
+    report(
+        "painted grid, one pad",
+        time_renders(grid, grid.rects, args.frames),
+        FRAME_BUDGET_MS,
+    )
+
+    # The previous implementation: one styled QPushButton per pad
+    widget = QWidget()
+    layout = QGridLayout(widget)
+    layout.setSpacing(20)
+    layout.setContentsMargins(20, 20, 20, 20)
+    buttons = []
+    for i in range(args.pads):
+        button = QPushButton(f"Button {i+1}")
+        button.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        button.setStyleSheet(
+            f"""
+            QPushButton {{
+                background-color: {PAD_COLORS[i % len(PAD_COLORS)]};
+                color: white;
+                border: none;
+                border-radius: 15px;
+                font-size: 24px;
+                font-weight: bold;
+            }}
+        """
+        )
+        layout.addWidget(button, i // columns, i % columns)
+        buttons.append(button)
+    widget.resize(args.width, args.height)
+    widget.show()
+    app.processEvents()
+
+    report("styled buttons, full frame", time_renders(widget, full, args.frames), FRAME_BUDGET_MS)
+    report(
+        "styled buttons, one button",
+        time_renders(widget, [b.geometry() for b in buttons], args.frames),
+        FRAME_BUDGET_MS,
+    )
+
+
+def bench_control(args):
+    """Control server load test with local client stand-ins"""
+    from control_server import ControlClient, ControlServer
+
+    engine = fake_engine(args.pads)
+    socket_path = Path(tempfile.mkdtemp()) / "control.sock"
+    server = ControlServer(
+        {"press": engine.press, "send": engine.send},
+        port=0,
+        socket_path=socket_path,
+        rate=args.rate,
+        burst=args.rate,
+        queue_size=args.queue,
+    )
+    server.start()
+
+    def run_client(number, latencies, rejected):
+        if number % 2:
+            client = ControlClient.connect_tcp(server.port)
+        else:
+            client = ControlClient.connect_unix(socket_path)
+        batch = [{"press": i % args.pads} for i in range(args.batch_size)]
+        sent_at = {}
+        # Keep a window of batches in flight, like a script that streams
+        for _ in range(min(args.window, args.batches)):
+            sent_at[client.send_batch(batch)] = time.perf_counter()
+        for done in range(args.batches):
+            reply = client.read_reply()
+            latencies.append((time.perf_counter() - sent_at.pop(reply["id"])) * 1000)
+            if "error" in reply:
+                rejected.append(reply)
+            if done + len(sent_at) < args.batches:
+                sent_at[client.send_batch(batch)] = time.perf_counter()
+        client.close()
+
+    latencies = []
+    rejected = []
+    threads = [
+        threading.Thread(target=run_client, args=(i, latencies, rejected))
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    print(
+        f"{args.clients} clients, {args.batches} batches of {args.batch_size} "
+        f"commands each, {args.window} batches in flight per client"
+    )
+    print(
+        f"{server.commands_executed / elapsed:,.0f} commands/s, "
+        f"{engine.midi_out.message_count / elapsed:,.0f} MIDI messages/s, "
+        f"{len(rejected)} batches rate limited"
+    )
+    report("batch round trip", latencies)
+
+
+def bench_osc(args):
+    """OSC in to OSC out over loopback UDP through the routing engine"""
+    import socket
+
+    from osc import OscBridge, decode_packet, encode_message
+
+    # Pads triggered by /pad/<n> that send /out/<n> back out
+    engine = fake_engine(
+        args.pads,
+        {
+            f"Button {i+1}": {
+                "input_type": "osc",
+                "input_address": f"/pad/{i}",
+                "output_type": "osc",
+                "output_address": f"/out/{i}",
+                "output_value": i,
+            }
+            for i in range(args.pads)
+        },
+    )
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    sink.bind(("127.0.0.1", 0))
+    sink.settimeout(0.5)
+    bridge = OscBridge(
+        engine.handle_osc, listen_port=0, send_port=sink.getsockname()[1]
+    )
+    bridge.start()
+    engine.osc_send = bridge.send
+
+    packets = [encode_message(f"/pad/{i}", [1.0]) for i in range(args.pads)]
+    received = 0
+
+    def drain():
+        nonlocal received
+        try:
+            while True:
+                sink.recv(65536)
+                received += 1
+        except socket.timeout:
+            pass
+
+    receiver = threading.Thread(target=drain)
+    receiver.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = 1 / args.rate if args.rate else 0
+    start = time.perf_counter()
+    for n in range(args.messages):
+        sender.sendto(packets[n % args.pads], bridge.listen_address)
+        if interval:
+            # Busy wait, sleep() is too coarse for these rates
+            deadline = start + (n + 1) * interval
+            while time.perf_counter() < deadline:
+                pass
+    sent_elapsed = time.perf_counter() - start
+    receiver.join()
+    elapsed = time.perf_counter() - start - 0.5  # Minus the drain timeout
+    bridge.stop()
+    sink.close()
+    sender.close()
+
+    print(
+        f"{args.messages} messages sent in {sent_elapsed:.3f} s "
+        f"({args.messages / sent_elapsed:,.0f}/s), "
+        f"{bridge.packets_received} received by the bridge, "
+        f"{received} routed back out ({received / elapsed:,.0f}/s), "
+        f"{args.messages - received} lost"
+    )
+
+    # The per-message costs without the network
+    samples = []
+    for n in range(2000):
+        data = packets[n % args.pads]
+        t = time.perf_counter()
+        for address, message_args in decode_packet(data):
+            engine.router.route_osc(address, message_args)
+        samples.append((time.perf_counter() - t) * 1000)
+    report("decode and route one message", samples)
+
+
+def record_synthetic(path, events, rate, pads):
+    """Record a session of mixed MIDI input and pad presses"""
+    import random
+
+    from midi_recorder import MidiRecorder
+
+    recorder = MidiRecorder(path)
+    recorder.start()
+    interval = 1 / rate
+    start = time.perf_counter()
+    for n in range(events):
+        while time.perf_counter() < start + n * interval:
+            pass
+        choice = random.random()
+        if choice < 0.5:
+            recorder.record_midi([0x90, random.randrange(pads), 100])
+        elif choice < 0.9:
+            recorder.record_midi([0xB0, random.randrange(128), random.randrange(128)])
+        else:
+            recorder.record_press(random.randrange(pads))
+    recorder.stop()
+
+
+def bench_soak(args):
+    """Replay a recorded log through the routing engine and watch for drift"""
+    import gc
+
+    from midi_backend import create_midi_out
+    from midi_recorder import read_log, replay
+    from resource_monitor import ResourceMonitor, rss_mb
+
+    log = args.log
+    if log is None:
+        log = Path(tempfile.mkdtemp()) / "synthetic.midirec"
+        print(f"Recording {args.events} synthetic events at {args.rate:g}/s to {log}")
+        record_synthetic(log, args.events, args.rate, args.pads)
+    events = read_log(log)
+    if not events:
+        sys.exit(f"{log} has no events")
+
+    midi_out = None
+    if args.port:
+        # The real backend, e.g. a loopback port to a second machine
+        midi_out = create_midi_out()
+        ports = midi_out.get_ports()
+        if args.port not in ports:
+            sys.exit(f"No MIDI output {args.port!r}, available: {ports}")
+        midi_out.open_port(ports.index(args.port))
+    engine = fake_engine(args.pads, midi_out=midi_out)
+
+    duration = events[-1][0]
+    speed = f"{args.speed:g}x" if args.speed else "max speed"
+    print(f"Replaying {len(events)} events ({duration:.1f} s) {args.loops} times at {speed}")
+    monitor = ResourceMonitor(
+        {"RSS (MB)": rss_mb, "Python objects": lambda: len(gc.get_objects())},
+        window=min(10, args.loops),
+    )
+    first = None
+    for loop in range(args.loops):
+        start = time.perf_counter()
+        delays = replay(events, engine, args.speed)
+        elapsed = time.perf_counter() - start
+        if first is None:
+            first = statistics.median(delays)
+        warnings = monitor.sample()
+        print(
+            f"loop {loop + 1}: {len(events) / elapsed:,.0f} events/s, "
+            f"RSS {monitor.latest()['RSS (MB)']:.1f} MB, "
+            f"median drift {statistics.median(delays) - first:+.3f} ms"
+        )
+        report(f"loop {loop + 1} dispatch delay", delays)
+        for warning in warnings:
+            print(f"WARNING {warning}")
+
+
+def ui_load(stop):
+    """Stand-in for the GUI thread: 60 frames/s of Python work and garbage"""
+    while not stop.is_set():
+        frame_end = time.perf_counter() + 0.008
+        while time.perf_counter() < frame_end:
+            # Reference cycles, so the garbage collector has work to do
+            nodes = [{"parent": None, "values": list(range(20))} for _ in range(200)]
+            for node in nodes:
+                node["parent"] = node
+        time.sleep(0.008)
+
+
+def measure_input_latency(engine, dispatch, rate, seconds):
+    """Latency from an input message to its first output message, in ms"""
+    from collections import deque
+
+    injected = deque()
+    latencies = []
+    send = engine.midi_out.send_message
+
+    def timed_send(message):
+        send(message)
+        if message[0] == 0x90:
+            latencies.append((time.perf_counter() - injected.popleft()) * 1000)
+
+    engine.midi_out.send_message = timed_send
+    interval = 1 / rate
+    start = time.perf_counter()
+    count = int(rate * seconds)
+    for n in range(count):
+        # Sleep like the rtmidi thread waiting on the driver, so the GIL is free
+        due = start + n * interval
+        wait = due - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        message = [0x90, n % 8, 100]  # A new list per message, like rtmidi
+        # Timed from when the message was due, so waiting for the GIL counts.
+        # Includes the sleep overshoot, the same in both modes
+        injected.append(due)
+        dispatch(message)
+    while len(latencies) < count:
+        time.sleep(0.01)
+    engine.midi_out.send_message = send
+    return latencies
+
+
+def bench_realtime(args):
+    """MIDI input to output latency under UI load, default vs real-time mode"""
+    from midi_worker import MidiWorker, available_cores, pin_thread, tune_interpreter
+
+    engine = fake_engine()
+    engine.midi_out.sent = []  # Grows, but avoids deque work in the timing
+
+    # Matching a message should not allocate
+    message = [0x92, 3, 100]
+    blocks = sys.getallocatedblocks()
+    for _ in range(10000):
+        engine.router.match(message)
+    print(f"allocated blocks after 10000 matches: {sys.getallocatedblocks() - blocks}")
+
+    def run(mode, dispatch, load_cores=None):
+        stop = threading.Event()
+
+        def load():
+            if load_cores:
+                pin_thread(load_cores)
+            ui_load(stop)
+
+        loader = threading.Thread(target=load)
+        loader.start()
+        # The injecting thread stands in for the rtmidi callback thread
+        results = []
+        injector = threading.Thread(
+            target=lambda: results.extend(
+                measure_input_latency(engine, dispatch, args.rate, args.seconds)
+            )
+        )
+        injector.start()
+        injector.join()
+        stop.set()
+        loader.join()
+        report(mode, results)
+
+    run("default mode", engine.handle_input)
+
+    cores = available_cores()
+    core = cores[-1]
+    worker = MidiWorker(core, args.fifo_priority)
+    worker.start()
+    tune_interpreter()
+    print(
+        f"real-time mode: worker on core {core} of {len(cores)}, "
+        f"pinned: {worker.pinned}, SCHED_FIFO: {worker.fifo}"
+    )
+    handle_input = engine.handle_input
+    run(
+        "real-time mode",
+        lambda message: worker.put(handle_input, message),
+        set(cores) - {core} if len(cores) > 1 else None,
+    )
+    worker.stop()
+
+
+def bench_sysex(args):
+    """SysEx dump throughput and note latency during a paced dump"""
+    # A dump of 128 byte messages on pad 0, a note on pad 1
+    message = "F0 43 10 4C " + " ".join(["01"] * 123) + " F7"
+    engine = fake_engine(
+        2,
+        {
+            "Dump": {
+                "output_type": "sysex",
+                "output_sysex": " ".join([message] * (args.size // 128)),
+            },
+            "Note": {"input_number": 1, "output_number": 60},
+        },
+    )
+    dump = engine.router.table.outputs[0][0]
+    sender = engine.sysex_sender
+    print(f"dump of {len(dump)} messages, {dump.size} bytes")
+
+    sender.bytes_per_second = 0
+    start = time.perf_counter()
+    for _ in range(args.dumps):
+        engine.press(0)
+    while not sender.idle():
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    print(
+        f"unpaced: {args.dumps} dumps in {elapsed:.3f} s, "
+        f"{sender.bytes_sent / elapsed / 1e6:.1f} MB/s"
+    )
+
+    # Paced: notes pressed during the dump must not wait for it
+    sender.bytes_per_second = args.rate
+    sender.bytes_sent = 0
+    latencies = []
+    start = time.perf_counter()
+    engine.press(0)
+    while not sender.idle():
+        t = time.perf_counter()
+        engine.press(1)
+        latencies.append((time.perf_counter() - t) * 1000)
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    sender.stop()
+    print(
+        f"paced at {args.rate:,} bytes/s: {dump.size} bytes in {elapsed:.3f} s "
+        f"({dump.size / elapsed:,.0f} bytes/s)"
+    )
+    report("note press during the dump", latencies)
+
+
+def bench_process(args):
+    """IPC overhead of the engine process: press round trips and mapping updates"""
+    from engine_process import EngineProcess
+
+    engine = fake_engine(args.pads)
+    router = engine.router
+    inputs = [router.table.inputs[i] for i in range(args.pads)]
+    outputs = [router.table.outputs[i] for i in range(args.pads)]
+
+    # In process: the press itself
+    samples = []
+    for n in range(args.presses):
+        start = time.perf_counter()
+        engine.press(n % args.pads)
+        samples.append((time.perf_counter() - start) * 1000)
+    report("in-process press", samples)
+
+    process = EngineProcess(args.pads, fake_midi=True)
+    process.start()
+    process.load(inputs, outputs, args.pads, None)
+    process.connect("Fake MIDI Port", "Fake MIDI Port")
+    process.ping()
+    triggers = process.state.triggers
+
+    def round_trips(name):
+        # Until the press shows up in the shared pad state
+        samples = []
+        for n in range(args.presses):
+            index = n % args.pads
+            count = triggers[index]
+            start = time.perf_counter()
+            process.press(index)
+            while triggers[index] == count:
+                pass
+            samples.append((time.perf_counter() - start) * 1000)
+        report(name, samples)
+
+    round_trips("engine process press")
+    stop = threading.Event()
+    loader = threading.Thread(target=ui_load, args=(stop,))
+    loader.start()
+    round_trips("engine process press, UI load")
+    stop.set()
+    loader.join()
+
+    start = time.perf_counter()
+    for n in range(args.updates):
+        index = n % args.pads
+        process.update(index, inputs[index], outputs[index])
+    process.ping()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.updates} mapping updates in {elapsed:.3f} s, "
+        f"{elapsed / args.updates * 1e6:.1f} us each"
+    )
+    process.stop()
+
+
+# Switch edges (ms, down) captured from foot switches, with the contact
+# bounce of pressing and releasing, and the pads each gesture should press
+# with 10 ms debouncing: (pad, ms). Pad 0 reacts to presses, 1 to taps,
+# 2 to double taps and 3 to long presses.
+BOUNCE_PATTERNS = {
+    "tap": (
+        [(0, 1), (0.4, 0), (1.1, 1), (2.3, 0), (2.9, 1), (180, 0), (181.6, 1), (182.1, 0)],
+        [(0, 0), (1, 480)],
+    ),
+    "double tap": (
+        [(0, 1), (0.8, 0), (1.5, 1), (120, 0), (121.2, 1), (122, 0),
+         (260, 1), (260.6, 0), (263.8, 1), (390, 0), (393.1, 1), (394, 0)],
+        [(0, 0), (0, 260), (2, 260)],
+    ),
+    "long press": (
+        [(0, 1), (2.2, 0), (3.0, 1), (4.7, 0), (5.1, 1), (950, 0), (950.9, 1), (951.8, 0)],
+        [(0, 0), (3, 600)],
+    ),
+    "worn switch": (
+        # Bounces for 8 ms, and its release bounces back closed after 9 ms
+        [(0, 1), (1.0, 0), (2.5, 1), (4.0, 0), (5.5, 1), (8.0, 0), (8.2, 1),
+         (200, 0), (209, 1), (209.5, 0)],
+        [(0, 0), (1, 500)],
+    ),
+    "repeated CC 127": (
+        # A switch that sends its "on" value again while held
+        [(0, 1), (40, 1), (80, 1), (120, 0)],
+        [(0, 0), (1, 420)],
+    ),
+}
+
+
+def replay_edges(detector, gesture, edges):
+    """Feed switch edges with simulated times, returning (pad, ms) presses"""
+    fired = []
+    deadline = None
+    for ms, down in edges + [(None, None)]:
+        # Deadlines before the next edge, at the time the thread would wake
+        while deadline is not None and (ms is None or deadline <= ms / 1000):
+            pads, next_deadline = detector.poll(deadline)
+            fired.extend((pad, round(deadline * 1000)) for pad in pads)
+            deadline = next_deadline
+        if ms is None:
+            break
+        now = ms / 1000
+        fired.extend((pad, round(ms)) for pad in detector.input(gesture, bool(down), now))
+        deadline = detector.poll(now)[1]
+    return fired
+
+
+def bench_gestures(args):
+    """Gesture detection against recorded switch bounce, and its input cost"""
+    from gestures import GestureDetector, GestureInput
+
+    pads = [(0, "press"), (1, "tap"), (2, "double_tap"), (3, "long_press")]
+    failed = 0
+    for name, (edges, expected) in BOUNCE_PATTERNS.items():
+        detector = GestureDetector(None, double_tap_ms=300, long_press_ms=600)
+        fired = replay_edges(detector, GestureInput(pads, 0.010), edges)
+        undebounced = replay_edges(
+            GestureDetector(None), GestureInput([(0, "press")]), edges
+        )
+        ok = fired == expected
+        failed += not ok
+        print(
+            f"{name:<16} {'OK  ' if ok else 'FAIL'} {fired}"
+            f"{'' if ok else f' expected {expected}'}"
+            f"  (presses without debouncing: {len(undebounced)})"
+        )
+
+    # Per message cost of the gesture layer on the input path
+    buttons = {
+        f"Button {i+1}": {
+            "input_type": "cc",
+            "input_number": i,
+            "output_type": "cc",
+            "output_number": i,
+        }
+        for i in range(8)
+    }
+    plain = fake_engine(8, buttons)
+    for button in buttons.values():
+        button["gesture"] = "tap"
+        button["debounce_ms"] = 10
+    gestures = fake_engine(8, buttons)
+    for name, engine in (("plain input, every message presses", plain), ("gesture input, taps fire later", gestures)):
+        samples = []
+        for n in range(args.messages):
+            message = [0xB0, n % 8, 127 if n // 8 % 2 else 0]
+            start = time.perf_counter()
+            engine.handle_input(message)
+            samples.append((time.perf_counter() - start) * 1000)
+        report(name, samples)
+    gestures.stop()
+    if failed:
+        sys.exit(f"{failed} bounce pattern(s) failed")
+
+
+def bench_banks(args):
+    """Bank switch time with many banks loaded, routing only and with relabeling"""
+    app = qt_app()
+    from config_schema import compile_config
+    from mapping_store import MappingStore
+    from pad_grid import PadGrid
+
+    config = {
+        "banks": [
+            {
+                "name": f"Bank {b+1}",
+                "buttons": {
+                    f"B{b+1} P{i+1}": {
+                        "input_number": i,
+                        "output_type": "cc",
+                        "output_number": i,
+                        "output_value": b % 128,
+                    }
+                    for i in range(args.pads)
+                },
+            }
+            for b in range(args.banks)
+        ]
+    }
+    start = time.perf_counter()
+    compiled = compile_config(config)
+    store = MappingStore(args.pads)
+    store.load(compiled)
+    engine = fake_engine(args.pads)
+    engine.router.load(store.inputs, store.outputs, store.pads)
+    print(
+        f"{args.banks} banks of {args.pads} pads compiled and loaded in "
+        f"{(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+
+    grid = PadGrid(args.pads, 8 if args.pads > 8 else 4)
+    grid.resize(800, 480)
+    grid.layout_pads()
+    grid.show()
+    app.processEvents()
+
+    def relabel(bank):
+        for i, name in enumerate(store.bank(bank)[0]):
+            grid.set_name(i, name)
+        app.processEvents()
+
+    engine.bank_listeners.append(relabel)
+    switches = [(i * 37) % args.banks for i in range(args.switches)]
+
+    router = engine.router
+    samples = []
+    for bank in switches:
+        start = time.perf_counter()
+        router.select(bank)
+        samples.append((time.perf_counter() - start) * 1000)
+    report("routing table swap", samples)
+
+    samples = []
+    for bank in switches:
+        start = time.perf_counter()
+        engine.select_bank(bank)
+        samples.append((time.perf_counter() - start) * 1000)
+    report("swap, relabel and repaint", samples, FRAME_BUDGET_MS)
+
+
+def thru_stepwise(stages):
+    """The thru pipeline without compiling, each stage applied in turn"""
+    from midi_thru import THRU_TYPES
+
+    def thru(message):
+        for stage in stages:
+            (kind, value), = stage.items()
+            status = message[0]
+            if kind == "types":
+                if not any(status >> 4 in THRU_TYPES[t] for t in value):
+                    return None
+            elif kind in ("channel", "channel_map") and status < 0xF0:
+                channels = (
+                    {c: value for c in range(1, 17)}
+                    if kind == "channel"
+                    else {int(k): v for k, v in value.items()}
+                )
+                channel = (status & 0x0F) + 1
+                if channel in channels:
+                    if channels[channel] is None:
+                        return None
+                    message = [status & 0xF0 | channels[channel] - 1, *message[1:]]
+            elif kind == "transpose" and status >> 4 in (0x8, 0x9, 0xA):
+                note = message[1] + value
+                if not 0 <= note <= 127:
+                    return None
+                message = [status, note, *message[2:]]
+            elif kind == "cc_map" and status >> 4 == 0xB:
+                numbers = {int(k): v for k, v in value.items()}
+                number = numbers.get(message[1], message[1])
+                if number is None:
+                    return None
+                message = [status, number, *message[2:]]
+        return message
+
+    return thru
+
+
+THRU_STAGES = [
+    {"types": ["note", "cc", "pitchbend"]},
+    {"channel_map": {"1": 2, "16": None}},
+    {"transpose": -12},
+    {"cc_map": {"1": 11, "64": None, "11": 7}},
+    {"transpose": 5},
+    {"channel": 3},
+]
+
+
+def bench_thru(args):
+    """MIDI thru: compiled vs. stage by stage, and merge throughput while pressing"""
+    from midi_thru import compile_thru
+
+    compiled = compile_thru(THRU_STAGES)
+    stepwise = thru_stepwise(THRU_STAGES)
+    messages = [
+        [status, number, 100]
+        for status in range(0x80, 0xF0)
+        for number in range(0, 128, 9)
+    ] + [[0xF8], [0xF2, 1, 2]]
+    wrong = [m for m in messages if compiled(m) != stepwise(m)]
+    print(
+        f"compiled pipeline matches stage by stage on {len(messages)} messages: "
+        f"{'OK' if not wrong else f'FAIL, e.g. {wrong[0]}'}"
+    )
+
+    for name, thru in (("stage by stage", stepwise), ("compiled", compiled)):
+        start = time.perf_counter()
+        for n in range(args.messages):
+            thru(messages[n % len(messages)])
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<16} {elapsed / args.messages * 1e6:6.2f} us/message, "
+            f"{args.messages / elapsed:10.0f} messages/s"
+        )
+
+    # Merge: unmapped input forwarded while pads are pressed from another thread
+    engine = fake_engine(args.pads)
+    engine.set_thru("unmapped", THRU_STAGES)
+    midi_out = engine.midi_out
+    stop = threading.Event()
+
+    def presses():
+        samples = []
+        n = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            engine.press(n % args.pads)
+            samples.append((time.perf_counter() - start) * 1000)
+            n += 1
+            time.sleep(0.001)
+        report("press while merging", samples)
+
+    presser = threading.Thread(target=presses)
+    presser.start()
+    count = midi_out.message_count
+    start = time.perf_counter()
+    for n in range(args.messages):
+        # CCs above the pad inputs, no pad uses them
+        engine.handle_input([0xB0, 64 + n % 32, n % 128])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    presser.join()
+    forwarded = midi_out.message_count - count
+    print(
+        f"merged {args.messages / elapsed:.0f} input messages/s "
+        f"({elapsed / args.messages * 1e6:.2f} us each, {forwarded} sent incl. presses)"
+    )
+    if wrong:
+        sys.exit(f"{len(wrong)} message(s) forwarded wrong")
+
+
+def bench_reload(args):
+    """Config hot-reload: full load vs. applying only the changed mappings"""
+    app = qt_app()
+    import json
+    from config_schema import load_config_file
+    from mapping_store import MappingStore
+    from pad_grid import PadGrid
+
+    config = {
+        "banks": [
+            {
+                "name": f"Bank {b+1}",
+                "buttons": {
+                    f"B{b+1} P{i+1}": {
+                        "input_number": i,
+                        "output_type": "cc",
+                        "output_number": i,
+                        "output_value": b % 128,
+                    }
+                    for i in range(args.pads)
+                },
+            }
+            for b in range(args.banks)
+        ]
+    }
+    path = Path(tempfile.mkdtemp()) / "reload.json"
+    store = MappingStore(args.pads)
+    engine = fake_engine(args.pads)
+    grid = PadGrid(args.pads, 8 if args.pads > 8 else 4)
+    grid.resize(800, 480)
+    grid.layout_pads()
+    grid.show()
+    app.processEvents()
+
+    def relabel(bank):
+        for i, name in enumerate(store.bank(bank)[0]):
+            grid.set_name(i, name)
+
+    def on_mapping_changed(delta):
+        # As MainWindow.on_mapping_changed
+        index, field, _, new = delta
+        if field == "name":
+            bank, pad = divmod(index, store.pads)
+            if bank == engine.bank:
+                grid.set_name(pad, new)
+        else:
+            engine.update(
+                index, store.inputs[index], store.outputs[index], store.gestures[index]
+            )
+
+    engine.bank_listeners.append(relabel)
+    store.listeners.append(on_mapping_changed)
+
+    def edit(n):
+        # One mapping changed per save, as when tweaking a file in an editor
+        bank = config["banks"][n % args.banks]
+        button = bank["buttons"][f"B{n % args.banks + 1} P{n % args.pads + 1}"]
+        button["output_value"] = (button["output_value"] + 1) % 128
+        path.write_text(json.dumps(config))
+
+    def full_load():
+        compiled = load_config_file(path)
+        store.load(compiled)
+        engine.load(store.inputs, store.outputs, store.pads, None, store.gestures)
+        app.processEvents()
+
+    cache = {}
+
+    def reload():
+        store.reload(load_config_file(path, cache))
+        app.processEvents()
+
+    for name, apply in (("full load", full_load), ("reload changed mappings", reload)):
+        samples = []
+        for n in range(args.reloads):
+            edit(n)
+            start = time.perf_counter()
+            apply()
+            samples.append((time.perf_counter() - start) * 1000)
+        report(name, samples, args.budget)
+
+
+def bench_touch(args):
+    """Touch to MIDI latency: touch-down fast path vs. mouse click on release"""
+    app = qt_app()
+    from PySide6.QtCore import QPoint, Qt
+    from PySide6.QtTest import QTest
+
+    from pad_grid import PadGrid
+
+    engine = fake_engine(args.pads)
+    sent_at = []
+    engine.midi_out.send_message = lambda message: sent_at.append(time.perf_counter())
+    grid = PadGrid(args.pads, 8 if args.pads > 8 else 4)
+    grid.resize(800, 480)
+    grid.show()
+    app.processEvents()
+    grid.padClicked.connect(engine.press)
+    grid.padTouched.connect(engine.press)
+    device = QTest.createTouchDevice()
+
+    # Each tap returns the time of the event that sends: touch down for
+    # touches, the release for clicks. With a finger, a click also waits for
+    # the finger to lift, which isn't part of these numbers.
+    def touch(pos):
+        start = time.perf_counter()
+        QTest.touchEvent(grid, device).press(0, pos).commit()
+        QTest.touchEvent(grid, device).release(0, pos).commit()
+        return start
+
+    def click(pos):
+        QTest.mousePress(grid, Qt.LeftButton, Qt.NoModifier, pos)
+        start = time.perf_counter()
+        QTest.mouseRelease(grid, Qt.LeftButton, Qt.NoModifier, pos)
+        return start
+
+    for name, tap in (
+        ("touch down to MIDI", touch),
+        ("click release to MIDI", click),
+    ):
+        samples = []
+        for n in range(args.taps):
+            pos = grid.rects[n % args.pads].center()
+            count = len(sent_at)
+            start = tap(pos)
+            app.processEvents()
+            if len(sent_at) == count:
+                sys.exit(f"{name}: pad {n % args.pads} sent nothing")
+            samples.append((sent_at[count] - start) * 1000)
+        report(name, samples)
+
+    # Hit testing on its own: grid arithmetic vs. a test against every rectangle
+    points = [QPoint(x, y) for x in range(0, 800, 7) for y in range(0, 480, 7)]
+    for name, hit in (
+        ("hit test, grid arithmetic", grid.pad_at),
+        ("hit test, every rectangle", lambda pos: next(
+            (i for i, rect in enumerate(grid.rects) if rect.contains(pos)), None
+        )),
+    ):
+        start = time.perf_counter()
+        for pos in points:
+            hit(pos)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<32} {elapsed / len(points) * 1e6:.2f} us per point")
+
+
+def bench_journal(args):
+    """Crash recovery: edits, undo/redo, another config, then a restart"""
+    app = qt_app()
+    import json
+
+    import ui
+
+    directory = Path(tempfile.mkdtemp())
+    os.chdir(directory)  # The app keeps its configs under the working directory
+    options = ui.parse_args(["--fake-midi"])[0]
+
+    def snapshot(window):
+        store = window.store
+        return (
+            list(store.names),
+            [dict(mapping) for mapping in store.mappings],
+            list(store.history),
+            list(store.redo_stack),
+        )
+
+    def edit(window, count):
+        store = window.store
+        for n in range(count):
+            index = n % len(store)
+            value = (store.get(index, "output_value") + n) % 128
+            store.set_field(index, "output_value", value)
+            if n % 7 == 0:
+                store.set_field(index, "name", f"Pad {n}")
+
+    window = ui.MainWindow(options)
+    start = time.perf_counter()
+    # Enough to compact the journal at least once
+    edit(window, args.edits)
+    window.undo()
+    window.undo()
+    window.redo()
+
+    other = directory / "configs" / "other.json"
+    other.write_text(
+        json.dumps(
+            {
+                "buttons": {
+                    f"Other {i+1}": {"output_type": "cc", "output_number": i}
+                    for i in range(8)
+                }
+            }
+        )
+    )
+    window.load_config(other)
+    # Fewer than a compaction's worth, so they sit in the journal on top
+    # of the snapshot written for this config
+    edit(window, 5)
+    window.undo()
+    expected = snapshot(window)
+    elapsed = time.perf_counter() - start
+
+    # A crash: the window is never closed, a new one recovers from the files
+    recovered = ui.MainWindow(options)
+    failed = 0
+    for name, a, b in zip(
+        ("names", "mappings", "undo history", "redo stack"),
+        expected,
+        snapshot(recovered),
+    ):
+        ok = a == b
+        failed += not ok
+        print(f"{name:<16} {'OK' if ok else 'FAIL'}")
+
+    # The recovered history must undo to the same state as the live one.
+    # The crashed window no longer writes the journal.
+    window.store.history_listeners.clear()
+    window.undo()
+    recovered.undo()
+    ok = snapshot(window) == snapshot(recovered)
+    failed += not ok
+    print(f"{'undo after restart':<16} {'OK' if ok else 'FAIL'}")
+
+    # A partial line left by a crash during a write is skipped
+    with open(directory / "configs" / "temp_config.journal", "a") as f:
+        f.write('["do", [[0, "output_value", 1')
+    ok = snapshot(ui.MainWindow(options)) == snapshot(recovered)
+    failed += not ok
+    print(f"{'torn last entry':<16} {'OK' if ok else 'FAIL'}")
+
+    print(f"{args.edits + 5} edits journaled in {elapsed:.2f} s")
+    app.processEvents()
+    if failed:
+        sys.exit(f"{failed} recovery check(s) failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    repaint = subparsers.add_parser("repaint", help=bench_repaint.__doc__)
+    repaint.add_argument("--pads", type=int, default=32)
+    repaint.add_argument("--frames", type=int, default=300)
+    repaint.add_argument("--width", type=int, default=800)
+    repaint.add_argument("--height", type=int, default=480)
+    repaint.set_defaults(func=bench_repaint)
+
+    control = subparsers.add_parser("control", help=bench_control.__doc__)
+    control.add_argument("--clients", type=int, default=4)
+    control.add_argument("--batches", type=int, default=500)
+    control.add_argument("--batch-size", type=int, default=50)
+    control.add_argument("--window", type=int, default=8)
+    control.add_argument("--pads", type=int, default=8)
+    control.add_argument("--queue", type=int, default=64)
+    control.add_argument(
+        "--rate", type=float, default=1e9, help="per-client commands/s limit"
+    )
+    control.set_defaults(func=bench_control)
+
+    osc = subparsers.add_parser("osc", help=bench_osc.__doc__)
+    osc.add_argument("--messages", type=int, default=20000)
+    osc.add_argument("--pads", type=int, default=8)
+    osc.add_argument(
+        "--rate", type=float, default=5000, help="messages/s to send, 0 for no pacing"
+    )
+    osc.set_defaults(func=bench_osc)
+
+    soak = subparsers.add_parser("soak", help=bench_soak.__doc__)
+    soak.add_argument("log", nargs="?", help="log recorded with ui.py --record")
+    soak.add_argument("--speed", type=float, default=1, help="0 for max speed")
+    soak.add_argument("--loops", type=int, default=3)
+    soak.add_argument("--pads", type=int, default=8)
+    soak.add_argument("--port", help="send to this MIDI output instead of a fake port")
+    soak.add_argument(
+        "--events", type=int, default=10000, help="synthetic log size, without a log"
+    )
+    soak.add_argument("--rate", type=float, default=1000, help="synthetic events/s")
+    soak.set_defaults(func=bench_soak)
+
+    realtime = subparsers.add_parser("realtime", help=bench_realtime.__doc__)
+    realtime.add_argument("--rate", type=float, default=1000, help="messages/s")
+    realtime.add_argument("--seconds", type=float, default=5)
+    realtime.add_argument("--fifo-priority", type=int, default=50)
+    realtime.set_defaults(func=bench_realtime)
+
+    sysex = subparsers.add_parser("sysex", help=bench_sysex.__doc__)
+    sysex.add_argument("--size", type=int, default=8192, help="dump size in bytes")
+    sysex.add_argument("--dumps", type=int, default=200)
+    sysex.add_argument(
+        "--rate", type=int, default=31250, help="paced bytes/s (USB MIDI-like)"
+    )
+    sysex.set_defaults(func=bench_sysex)
+
+    gestures = subparsers.add_parser("gestures", help=bench_gestures.__doc__)
+    gestures.add_argument("--messages", type=int, default=20000)
+    gestures.set_defaults(func=bench_gestures)
+
+    process = subparsers.add_parser("process", help=bench_process.__doc__)
+    process.add_argument("--pads", type=int, default=8)
+    process.add_argument("--presses", type=int, default=5000)
+    process.add_argument("--updates", type=int, default=20000)
+    process.set_defaults(func=bench_process)
+
+    banks = subparsers.add_parser("banks", help=bench_banks.__doc__)
+    banks.add_argument("--banks", type=int, default=128)
+    banks.add_argument("--pads", type=int, default=8)
+    banks.add_argument("--switches", type=int, default=1000)
+    banks.set_defaults(func=bench_banks)
+
+    reload = subparsers.add_parser("reload", help=bench_reload.__doc__)
+    reload.add_argument("--banks", type=int, default=1)
+    reload.add_argument("--pads", type=int, default=8)
+    reload.add_argument("--reloads", type=int, default=200)
+    reload.add_argument("--budget", type=float, default=5, help="ms")
+    reload.set_defaults(func=bench_reload)
+
+    journal = subparsers.add_parser("journal", help=bench_journal.__doc__)
+    journal.add_argument("--edits", type=int, default=300)
+    journal.set_defaults(func=bench_journal)
+
+    touch = subparsers.add_parser("touch", help=bench_touch.__doc__)
+    touch.add_argument("--pads", type=int, default=8)
+    touch.add_argument("--taps", type=int, default=200)
+    touch.set_defaults(func=bench_touch)
+
+    thru = subparsers.add_parser("thru", help=bench_thru.__doc__)
+    thru.add_argument("--messages", type=int, default=100000)
+    thru.add_argument("--pads", type=int, default=8)
+    thru.set_defaults(func=bench_thru)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""Configuration schema for the MIDI controller.
+
+The schema below is compiled once at import time into a list of field
+checkers. Loading a config runs every checker, collects all problems into a
+single ConfigError and produces the compact structures the router uses at
+runtime, so nothing on the send path has to re-check types or ranges.
+"""
+import json
+from pathlib import Path
+
+from gestures import DOUBLE_TAP_MS, GESTURES, LONG_PRESS_MS
+from midi_router import BankSwitch
+from midi_thru import compile_tables
+from osc import encode_message
+from sysex import DIN_BYTES_PER_SECOND, parse_sysex, sysex_messages
+
+MIDI_TYPES = ["note", "cc", "pc"]
+# Inputs and outputs can also be OSC addresses
+MESSAGE_TYPES = MIDI_TYPES + ["osc"]
+# SysEx and bank switches are output only. "bank" switches to the bank
+# given by the output number, counting from 0.
+OUTPUT_TYPES = MESSAGE_TYPES + ["sysex", "bank", "bank_next", "bank_prev"]
+
+# Status byte (channel 1) for each message type
+STATUS_BYTES = {"note": 0x90, "cc": 0xB0, "pc": 0xC0}
+
+# Field name -> rules. "default" is used when the field is missing.
+BUTTON_SCHEMA = {
+    "input_type": {"type": str, "choices": MESSAGE_TYPES, "default": "note"},
+    "input_number": {"type": int, "range": (0, 127), "default": None, "nullable": True},
+    "input_address": {"type": str, "prefix": "/", "default": None, "nullable": True},
+    "output_type": {"type": str, "choices": OUTPUT_TYPES, "default": "note"},
+    "output_number": {"type": int, "range": (0, 127), "default": None, "nullable": True},
+    "output_address": {"type": str, "prefix": "/", "default": None, "nullable": True},
+    "output_sysex": {"type": str, "parse": parse_sysex, "default": None, "nullable": True},
+    "output_value": {"type": int, "range": (0, 127), "default": 127},
+    "midi_message": {"type": list, "default": None, "nullable": True},
+    # Which gesture on the input presses the button, see gestures.py
+    "gesture": {"type": str, "choices": GESTURES, "default": "press"},
+    "debounce_ms": {"type": int, "range": (0, 1000), "default": 0},
+}
+
+PORTS_SCHEMA = {
+    "input": {"type": str, "default": None, "nullable": True},
+    "output": {"type": str, "default": None, "nullable": True},
+    # Pace of large SysEx dumps, 0 for as fast as the port takes them
+    "sysex_rate": {"type": int, "range": (0, 10**7), "default": DIN_BYTES_PER_SECOND},
+}
+
+# Incoming message that selects a bank: the value of a CC or the program
+# number of a PC, counting from 0
+BANK_SELECT_SCHEMA = {
+    "input_type": {"type": str, "choices": ["cc", "pc"], "default": None, "nullable": True},
+    "input_number": {"type": int, "range": (0, 127), "default": None, "nullable": True},
+}
+
+# Times that tell taps, double taps and long presses apart
+GESTURE_TIMING_SCHEMA = {
+    "double_tap_ms": {"type": int, "range": (50, 2000), "default": DOUBLE_TAP_MS},
+    "long_press_ms": {"type": int, "range": (100, 10000), "default": LONG_PRESS_MS},
+}
+
+# Forwarding of MIDI input to the output port, see midi_thru.py.
+# "unmapped" forwards the messages that no pad uses.
+THRU_SCHEMA = {
+    "forward": {"type": str, "choices": ["off", "unmapped", "all"], "default": "off"},
+    "stages": {"type": list, "parse": compile_tables, "default": []},
+}
+
+# OSC is off unless a port is set
+OSC_SCHEMA = {
+    "listen_host": {"type": str, "default": "127.0.0.1"},
+    "listen_port": {"type": int, "range": (0, 65535), "default": None, "nullable": True},
+    "send_host": {"type": str, "default": "127.0.0.1"},
+    "send_port": {"type": int, "range": (1, 65535), "default": None, "nullable": True},
+}
+
+
+class ConfigError(ValueError):
+    """Raised with every problem found in a configuration"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("\n".join(self.errors))
+
+
+def _compile_field(name, rules):
+    """Build a checker function for one field of the schema"""
+    expected = rules["type"]
+    default = rules.get("default")
+    nullable = rules.get("nullable", False)
+    choices = rules.get("choices")
+    low, high = rules.get("range", (None, None))
+    prefix = rules.get("prefix")
+    parse = rules.get("parse")
+
+    def check(value, path, errors):
+        if value is None:
+            if nullable:
+                return None
+            errors.append(f"{path}.{name}: value is required")
+            return default
+        # bool is a subclass of int, but true/false is never a MIDI number
+        if not isinstance(value, expected) or isinstance(value, bool):
+            errors.append(
+                f"{path}.{name}: expected {expected.__name__}, got {value!r}"
+            )
+            return default
+        if choices is not None and value not in choices:
+            errors.append(f"{path}.{name}: {value!r} is not one of {choices}")
+            return default
+        if low is not None and not low <= value <= high:
+            errors.append(f"{path}.{name}: {value} is outside {low}-{high}")
+            return default
+        if prefix is not None and not value.startswith(prefix):
+            errors.append(f"{path}.{name}: {value!r} does not start with {prefix!r}")
+            return default
+        if parse is not None:
+            try:
+                parse(value)
+            except ValueError as e:
+                errors.append(f"{path}.{name}: {e}")
+                return default
+        return value
+
+    return name, default, check
+
+
+def _compile_schema(schema):
+    return [_compile_field(name, rules) for name, rules in schema.items()]
+
+
+# Compiled once, reused for every load and every edit
+_BUTTON_FIELDS = _compile_schema(BUTTON_SCHEMA)
+_PORT_FIELDS = _compile_schema(PORTS_SCHEMA)
+_OSC_FIELDS = _compile_schema(OSC_SCHEMA)
+_BANK_SELECT_FIELDS = _compile_schema(BANK_SELECT_SCHEMA)
+_GESTURE_TIMING_FIELDS = _compile_schema(GESTURE_TIMING_SCHEMA)
+_THRU_FIELDS = _compile_schema(THRU_SCHEMA)
+_FIELD_CHECKS = {name: check for name, _, check in _BUTTON_FIELDS}
+
+
+def _normalize(raw, fields, path, errors):
+    if not isinstance(raw, dict):
+        errors.append(f"{path}: expected an object, got {raw!r}")
+        raw = {}
+    normalized = {}
+    for name, default, check in fields:
+        if name in raw:
+            normalized[name] = check(raw[name], path, errors)
+        else:
+            normalized[name] = default
+    return normalized
+
+
+def default_mapping():
+    """Return a button mapping with every field at its default"""
+    return {name: default for name, default, _ in _BUTTON_FIELDS}
+
+
+def validate_field(field, value):
+    """Validate a single button field, e.g. after an edit in the mappings table"""
+    errors = []
+    value = _FIELD_CHECKS[field](value, "button", errors)
+    if errors:
+        raise ConfigError(errors)
+    return value
+
+
+# Length of a message by status byte high nibble, and of system messages
+_MESSAGE_LENGTHS = {0x8: 3, 0x9: 3, 0xA: 3, 0xB: 3, 0xC: 2, 0xD: 2, 0xE: 3}
+_SYSTEM_LENGTHS = {0xF1: 2, 0xF2: 3, 0xF3: 2, 0xF6: 1, 0xF8: 1, 0xFA: 1, 0xFB: 1, 0xFC: 1, 0xFE: 1, 0xFF: 1}
+
+
+def check_midi_message(message):
+    """Check a raw MIDI message (a list of bytes) from outside the config
+
+    Raises ValueError unless it is a single complete message: a status
+    byte, data bytes below 0x80 and the length its status byte calls for.
+    """
+    if not isinstance(message, list) or not message:
+        raise ValueError(f"expected a list of bytes, got {message!r}")
+    if not all(isinstance(byte, int) and not isinstance(byte, bool) for byte in message):
+        raise ValueError(f"{message!r} holds something other than bytes")
+    status = message[0]
+    if not 0x80 <= status <= 0xFF:
+        raise ValueError(f"{message!r} doesn't start with a status byte")
+    if status == 0xF0:
+        # SysEx: any number of data bytes up to F7
+        data = message[1:-1]
+        if len(message) < 2 or message[-1] != 0xF7:
+            raise ValueError(f"{message!r}: SysEx must end with F7")
+    else:
+        data = message[1:]
+        length = _MESSAGE_LENGTHS.get(status >> 4) or _SYSTEM_LENGTHS.get(status)
+        if length is None:
+            raise ValueError(f"{message!r}: {status:#04x} is not a message status")
+        if len(message) != length:
+            raise ValueError(f"{message!r}: expected {length} bytes")
+    if not all(0 <= byte <= 0x7F for byte in data):
+        raise ValueError(f"{message!r}: data bytes must be 0-127")
+
+
+def input_key(mapping):
+    """Return the (status, number) pair incoming messages are matched on
+
+    OSC inputs are matched on ("osc", address) instead.
+    """
+    if mapping["input_type"] == "osc":
+        if mapping["input_address"] is None:
+            return None
+        return ("osc", mapping["input_address"])
+    if mapping["input_number"] is None:
+        return None
+    return (STATUS_BYTES[mapping["input_type"]], mapping["input_number"])
+
+
+def output_messages(mapping):
+    """Precompute the messages sent when the button is pressed"""
+    if mapping["output_type"] == "osc":
+        address = mapping["output_address"]
+        if address is None:
+            return ()
+        return (encode_message(address, [mapping["output_value"]]),)
+    if mapping["output_type"] == "sysex":
+        template = mapping["output_sysex"]
+        if template is None:
+            return ()
+        return sysex_messages(template, mapping["output_value"])
+    if mapping["output_type"] == "bank_next":
+        return (BankSwitch(step=1),)
+    if mapping["output_type"] == "bank_prev":
+        return (BankSwitch(step=-1),)
+    number = mapping["output_number"]
+    if number is None:
+        return ()
+    output_type = mapping["output_type"]
+    if output_type == "note":
+        # Note On followed by Note Off
+        return ([0x90, number, 127], [0x80, number, 0])
+    if output_type == "cc":
+        return ([0xB0, number, mapping["output_value"]],)
+    if output_type == "bank":
+        return (BankSwitch(bank=number),)
+    return ([0xC0, number],)
+
+
+def input_gesture(mapping):
+    """Return (gesture, debounce in seconds), or None for a plain press"""
+    if mapping["gesture"] == "press" and not mapping["debounce_ms"]:
+        return None
+    return (mapping["gesture"], mapping["debounce_ms"] / 1000)
+
+
+def bank_select_key(settings):
+    """Return the (status, number) of bank select messages, number None for PC"""
+    if settings["input_type"] == "pc":
+        return (0xC0, None)
+    if settings["input_type"] == "cc" and settings["input_number"] is not None:
+        return (0xB0, settings["input_number"])
+    return None
+
+
+def _compile_buttons(buttons, path, errors, cache=None):
+    if cache is not None:
+        cached = cache.get(path)
+        if cached is not None and cached[0] == buttons:
+            bank = dict(cached[1])
+            # Mappings are edited in place once loaded
+            bank["mappings"] = [dict(mapping) for mapping in bank["mappings"]]
+            return bank
+    error_count = len(errors)
+    if not isinstance(buttons, dict):
+        errors.append(f"{path}: expected an object, got {buttons!r}")
+        buttons = {}
+    names = []
+    mappings = []
+    for name, raw in buttons.items():
+        names.append(name)
+        mappings.append(_normalize(raw, _BUTTON_FIELDS, f"{path}.{name}", errors))
+    bank = {
+        "names": names,
+        "mappings": mappings,
+        "inputs": [input_key(mapping) for mapping in mappings],
+        "outputs": [output_messages(mapping) for mapping in mappings],
+        "gestures": [input_gesture(mapping) for mapping in mappings],
+    }
+    if cache is not None and len(errors) == error_count:
+        cache[path] = (buttons, dict(bank, mappings=[dict(m) for m in mappings]))
+    return bank
+
+
+def compile_config(config, cache=None):
+    """Validate a raw config dict and build its runtime structures.
+
+    `cache` is a dict kept by the caller between calls, banks whose buttons
+    are unchanged since the previous call are not validated again.
+    Raises ConfigError listing every invalid field.
+    """
+    errors = []
+    if not isinstance(config, dict):
+        raise ConfigError([f"config: expected an object, got {config!r}"])
+
+    # Either a single set of "buttons" or a list of "banks" of them
+    banks = []
+    if "banks" in config:
+        if "buttons" in config:
+            errors.append("buttons: not allowed together with banks")
+        raw_banks = config["banks"]
+        if not isinstance(raw_banks, list) or not raw_banks:
+            errors.append(f"banks: expected a list of banks, got {raw_banks!r}")
+            raw_banks = []
+        for number, raw in enumerate(raw_banks):
+            path = f"banks[{number}]"
+            if not isinstance(raw, dict):
+                errors.append(f"{path}: expected an object, got {raw!r}")
+                continue
+            bank = _compile_buttons(
+                raw.get("buttons", {}), f"{path}.buttons", errors, cache
+            )
+            bank["name"] = raw.get("name", f"Bank {number + 1}")
+            if not isinstance(bank["name"], str):
+                errors.append(f"{path}.name: expected str, got {bank['name']!r}")
+            banks.append(bank)
+    else:
+        bank = _compile_buttons(config.get("buttons", {}), "buttons", errors, cache)
+        bank["name"] = "Bank 1"
+        banks.append(bank)
+
+    bank_select = _normalize(
+        config.get("bank_select", {}), _BANK_SELECT_FIELDS, "bank_select", errors
+    )
+    ports = _normalize(
+        config.get("midi_ports", {}), _PORT_FIELDS, "midi_ports", errors
+    )
+    osc = _normalize(config.get("osc", {}), _OSC_FIELDS, "osc", errors)
+    thru = _normalize(config.get("thru", {}), _THRU_FIELDS, "thru", errors)
+    gesture_timing = _normalize(
+        config.get("gesture_timing", {}),
+        _GESTURE_TIMING_FIELDS,
+        "gesture_timing",
+        errors,
+    )
+
+    if errors:
+        raise ConfigError(errors)
+
+    return {
+        "banks": banks,
+        "bank_select": bank_select,
+        "bank_select_key": bank_select_key(bank_select),
+        "midi_ports": ports,
+        "osc": osc,
+        "gesture_timing": gesture_timing,
+        "thru": thru,
+    }
+
+
+def load_config_file(config_file, cache=None):
+    """Read and compile a JSON config file, see compile_config for `cache`"""
+    with open(Path(config_file), "r") as f:
+        try:
+            config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ConfigError([f"{config_file}: {e}"])
+    return compile_config(config, cache)
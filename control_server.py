@@ -0,0 +1,278 @@
+"""Local control server for stage automation.
+
+Scripts on the same machine (a laptop, a DAW) connect over a Unix socket or
+TCP on the loopback interface and send newline delimited JSON. Each line is
+a batch:
+
+    {"id": 1, "commands": [{"press": 3}, {"press": "DLY"},
+                           {"send": [[176, 7, 100]]}, {"scene": "live"}]}
+
+A bare JSON list of commands is accepted too. Every batch gets one reply
+line, {"id": 1, "ok": 4} or {"id": 1, "ok": 3, "errors": [...]}, once it has
+been executed. Batches from all clients go through one bounded queue. When
+it is full the server stops reading from the sockets, which pushes back on
+the clients. Each client also has a token bucket rate limit on commands and
+batches over the limit are rejected.
+
+The server runs its own asyncio loop in a background thread. The command
+handlers are called on that thread.
+"""
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_PORT = 7401
+DEFAULT_SOCKET = Path(tempfile.gettempdir()) / "midi_foot_ui.sock"
+MAX_BATCH = 256  # Commands per batch
+
+
+class RateLimiter:
+    """Token bucket: `rate` commands per second with bursts up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def take(self, count):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if count > self.tokens:
+            return False
+        self.tokens -= count
+        return True
+
+
+def parse_batch(line, max_commands=MAX_BATCH):
+    """Parse one line into (id, [(command, argument), ...])
+
+    Raises ValueError if the line is not a valid batch.
+    """
+    try:
+        batch = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}")
+    batch_id = None
+    if isinstance(batch, dict):
+        batch_id = batch.get("id")
+        batch = batch.get("commands")
+    if not isinstance(batch, list):
+        raise ValueError("expected a list of commands")
+    if len(batch) > max_commands:
+        raise ValueError(f"more than {max_commands} commands in one batch")
+
+    commands = []
+    for command in batch:
+        if not isinstance(command, dict) or len(command) != 1:
+            raise ValueError(f"invalid command {command!r}")
+        commands.append(next(iter(command.items())))
+    return batch_id, commands
+
+
+class ControlServer:
+    """Accepts command batches and feeds them to `handlers`
+
+    `handlers` maps a command name to a function taking its argument. A
+    handler raises ValueError for invalid arguments, any exception is
+    reported to the client as an error of its command.
+    """
+
+    def __init__(
+        self,
+        handlers,
+        port=DEFAULT_PORT,
+        socket_path=DEFAULT_SOCKET,
+        rate=1000,
+        burst=200,
+        queue_size=64,
+    ):
+        self.handlers = handlers
+        self.port = port
+        self.socket_path = Path(socket_path) if socket_path else None
+        self.rate = rate
+        self.burst = burst
+        # A larger batch could never get enough tokens, it is rejected as
+        # too large instead of rate limited forever
+        self.max_batch = min(MAX_BATCH, int(burst))
+        self.queue_size = queue_size
+
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.stopping = None
+        # Exception that kept the server from listening, raised by start()
+        self.error = None
+        self.clients = {}  # Connection handler task -> its writer
+        self.commands_executed = 0
+        self.batches_rejected = 0
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=asyncio.run, args=(self.serve(),), name="control-server", daemon=True
+        )
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            self.thread.join()
+            self.loop = None
+            raise self.error
+
+    def stop(self):
+        if self.loop is not None:
+            if self.loop.is_closed():
+                self.loop = None  # The server thread already ended
+                return
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.thread.join()
+            self.loop = None
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.queue = asyncio.Queue(self.queue_size)
+
+        servers = []
+        try:
+            if self.port is not None:
+                server = await asyncio.start_server(
+                    self.handle_client, "127.0.0.1", self.port
+                )
+                # Port 0 picks a free port
+                self.port = server.sockets[0].getsockname()[1]
+                servers.append(server)
+                print(f"Control server listening on 127.0.0.1:{self.port}")
+            if self.socket_path is not None:
+                if self.socket_path.exists():
+                    self.socket_path.unlink()
+                servers.append(
+                    await asyncio.start_unix_server(
+                        self.handle_client, str(self.socket_path)
+                    )
+                )
+                print(f"Control server listening on {self.socket_path}")
+        except Exception as e:
+            # e.g. the port is in use, start() raises it
+            self.error = e
+            for server in servers:
+                server.close()
+                await server.wait_closed()
+            return
+        finally:
+            self.ready.set()
+
+        worker = asyncio.create_task(self.execute_batches())
+        await self.stopping.wait()
+
+        worker.cancel()
+        for server in servers:
+            server.close()
+        # Closing the connections lets their handlers finish on their own
+        for writer in self.clients.values():
+            writer.close()
+        if self.clients:
+            await asyncio.wait(list(self.clients), timeout=1)
+        for server in servers:
+            await server.wait_closed()
+        if self.socket_path is not None and self.socket_path.exists():
+            os.unlink(self.socket_path)
+
+    async def handle_client(self, reader, writer):
+        limiter = RateLimiter(self.rate, self.burst)
+        task = asyncio.current_task()
+        self.clients[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    batch_id, commands = parse_batch(line, self.max_batch)
+                except ValueError as e:
+                    self.reply(writer, {"id": None, "error": str(e)})
+                    continue
+                if not limiter.take(len(commands)):
+                    self.batches_rejected += 1
+                    self.reply(writer, {"id": batch_id, "error": "rate limited"})
+                    continue
+                # Waits while the queue is full, so the client is slowed down
+                await self.queue.put((writer, batch_id, commands))
+                await writer.drain()
+        except ConnectionError:
+            pass  # Client went away, nothing to reply to
+        except ValueError as e:
+            # Line longer than the stream reader limit
+            print(f"Control client dropped: {e}")
+        finally:
+            del self.clients[task]
+            writer.close()
+
+    async def execute_batches(self):
+        while True:
+            writer, batch_id, commands = await self.queue.get()
+            done = 0
+            errors = []
+            for name, argument in commands:
+                handler = self.handlers.get(name)
+                if handler is None:
+                    errors.append(f"unknown command {name!r}")
+                    continue
+                try:
+                    handler(argument)
+                    done += 1
+                except Exception as e:
+                    # e.g. the engine process is gone, the queue must keep going
+                    errors.append(f"{name}: {e}")
+            self.commands_executed += done
+            reply = {"id": batch_id, "ok": done}
+            if errors:
+                reply["errors"] = errors
+            self.reply(writer, reply)
+
+    def reply(self, writer, reply):
+        if not writer.is_closing():
+            writer.write(json.dumps(reply).encode() + b"\n")
+
+
+class ControlClient:
+    """Minimal blocking client, for scripts and tests"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+        self.next_id = 0
+
+    @classmethod
+    def connect_tcp(cls, port=DEFAULT_PORT):
+        return cls(socket.create_connection(("127.0.0.1", port)))
+
+    @classmethod
+    def connect_unix(cls, path=DEFAULT_SOCKET):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(path))
+        return cls(sock)
+
+    def send_batch(self, commands):
+        """Send a batch without waiting for its reply, returning its id"""
+        self.next_id += 1
+        line = json.dumps({"id": self.next_id, "commands": commands})
+        self.sock.sendall(line.encode() + b"\n")
+        return self.next_id
+
+    def read_reply(self):
+        return json.loads(self.file.readline())
+
+    def execute(self, commands):
+        """Send a batch and wait for its reply"""
+        self.send_batch(commands)
+        return self.read_reply()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
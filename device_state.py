@@ -0,0 +1,89 @@
+"""Last known state of the connected MIDI devices.
+
+Messages in both directions update the cache: what we send and what the
+devices report back (e.g. an amp modeler announcing a preset change made on
+the unit itself). Entries are keyed by port name, and most MIDI drivers give
+the input and output of one device the same name. Feedback received on a
+port therefore describes what the output with that name holds.
+"""
+
+
+def state_key(message):
+    """Return ((status, number), value) for messages that set device state
+
+    Note Off is recorded as a Note On with value 0 and Program Change has no
+    number. Other messages return (None, None).
+    """
+    status = message[0]
+    kind = status & 0xF0
+    if kind == 0xB0 and len(message) > 2:
+        return (status, message[1]), message[2]
+    if kind == 0xC0 and len(message) > 1:
+        return (status, None), message[1]
+    if kind == 0x90 and len(message) > 2:
+        return (status, message[1]), message[2]
+    if kind == 0x80 and len(message) > 1:
+        return (status | 0x10, message[1]), 0
+    return None, None
+
+
+class DeviceStateCache:
+    """Value per (port, status, number) as last sent or received"""
+
+    def __init__(self):
+        self.values = {}
+        # Ports that report their state back, only those can be trusted
+        # enough to skip sends
+        self.feedback_ports = set()
+        self.saved_sends = 0
+
+    def clear(self):
+        """Forget everything, e.g. after ports were reopened"""
+        self.values.clear()
+        self.feedback_ports.clear()
+
+    def receive(self, port, message):
+        """Record a message received from a device
+
+        Returns (key, value) if it changed the known state, else None.
+        """
+        key, value = state_key(message)
+        if key is None:
+            return None
+        self.feedback_ports.add(port)
+        full_key = (port, key)
+        if self.values.get(full_key) == value:
+            return None
+        self.values[full_key] = value
+        return key, value
+
+    def sent(self, port, message):
+        """Record a message sent without asking should_send, e.g. MIDI thru
+
+        Returns (key, value) like state_key.
+        """
+        key, value = state_key(message)
+        if key is not None:
+            self.values[(port, key)] = value
+        return key, value
+
+    def should_send(self, port, message):
+        """Record a message about to be sent and tell if it changes anything
+
+        CC and Program Change messages are redundant when a port with
+        feedback already reports the same value. Notes are triggers rather
+        than state and are always sent.
+        """
+        key, value = state_key(message)
+        if key is None:
+            return True
+        full_key = (port, key)
+        if (
+            key[0] & 0xF0 != 0x90
+            and port in self.feedback_ports
+            and self.values.get(full_key) == value
+        ):
+            self.saved_sends += 1
+            return False
+        self.values[full_key] = value
+        return True
@@ -0,0 +1,318 @@
+"""MIDI engine in a separate process.
+
+With `--engine-process` the MIDI ports, the routing tables and the engine
+live in a child process, so a stalled GUI thread (a modal file dialog, a
+long dialog rebuild) no longer holds the GIL that MIDI is handled under.
+The UI sends commands (presses, mapping updates, port changes) over a pipe
+and the engine publishes pad activity in a PadState on shared memory, which
+the UI samples like the in-process one. Events come back over the pipe:
+bank switches, OSC output and the MIDI input while learning or recording.
+
+The child is started with `python engine_process.py <pipe fd> <state fd>`
+rather than multiprocessing, so it never imports Qt.
+"""
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import traceback
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+
+from pad_state import NO_VALUE, PadState
+
+
+class EngineProcess:
+    """Runs a MidiEngine in a child process, behind the MidiEngine interface
+
+    Commands are queued on the pipe and return without waiting for the
+    engine. `bank` follows the engine's bank switches.
+    """
+
+    def __init__(
+        self, pads, fake_midi=False, forward_input=False, core=None, fifo_priority=0
+    ):
+        self.pads = pads
+        self.options = {
+            "pads": pads,
+            "fake_midi": fake_midi,
+            "forward_input": forward_input,
+            "core": core,
+            "fifo_priority": fifo_priority,
+        }
+        self.process = None
+        self.conn = None
+        self.reader = None
+        # Commands come from the GUI, the control server and the OSC thread
+        self.send_lock = threading.Lock()
+        # Pad activity, written by the engine process
+        self.state = None
+        self.bank = 0
+        self.banks = 1
+        # Called with the bank number after a bank switch, on the event thread
+        self.bank_listeners = []
+        # Called with each OscPacket of an output, e.g. OscBridge.send
+        self.osc_send = None
+        # Called with the MIDI input forwarded while learning or recording
+        self.input_handler = None
+        self.saved_sends = 0
+        self.pongs = 0
+        self.pong = threading.Condition()
+
+    def start(self):
+        size = PadState.buffer_size(self.pads)
+        # An unlinked temporary file, shared by passing its descriptor
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        self.state_file = tempfile.TemporaryFile(dir=shm_dir)
+        self.state_file.truncate(size)
+        self.state = PadState(self.pads, mmap.mmap(self.state_file.fileno(), size))
+        self.state.values[:] = bytes([NO_VALUE]) * self.pads
+
+        self.conn, child_conn = Pipe()
+        fds = (child_conn.fileno(), self.state_file.fileno())
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), *map(str, fds)],
+            pass_fds=fds,
+        )
+        child_conn.close()
+        self.conn.send(self.options)
+        self.reader = threading.Thread(
+            target=self.read_events, name="engine-events", daemon=True
+        )
+        self.reader.start()
+
+    def stop(self):
+        """Stop the engine process, waiting for it to close its ports"""
+        if self.process is None:
+            return
+        try:
+            self.command("stop")
+        except OSError:
+            pass  # Already gone
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            print("Engine process did not stop, killing it")
+            self.process.kill()
+            self.process.wait()
+        self.reader.join()
+        self.conn.close()
+        self.process = None
+
+    def command(self, name, *args):
+        with self.send_lock:
+            self.conn.send((name, args))
+
+    def read_events(self):
+        while True:
+            try:
+                event = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = event[0]
+            try:
+                if kind == "bank":
+                    self.bank = event[1]
+                    for listener in self.bank_listeners:
+                        listener(event[1])
+                elif kind == "osc":
+                    if self.osc_send is not None:
+                        self.osc_send(event[1])
+                elif kind == "input":
+                    if self.input_handler is not None:
+                        self.input_handler(event[1])
+                elif kind == "pong":
+                    with self.pong:
+                        self.pongs = event[1]
+                        self.pong.notify_all()
+                elif kind == "stopped":
+                    self.saved_sends = event[1]
+            except Exception:
+                traceback.print_exc()
+        if self.process is not None and self.process.poll() is not None:
+            print(f"Engine process exited with code {self.process.returncode}")
+
+    def ping(self, timeout=1.0):
+        """Wait until the engine has executed every command sent so far"""
+        with self.pong:
+            token = self.pongs + 1
+            self.command("ping", token)
+            return self.pong.wait_for(lambda: self.pongs >= token, timeout)
+
+    # The MidiEngine interface
+
+    def set_ports(self, input_port, output_port):
+        self.command("set_ports", input_port, output_port)
+
+    def connect(self, input_port, output_port):
+        """Reopen the engine's MIDI ports, by name"""
+        self.command("connect", input_port, output_port)
+
+    def load(self, inputs, outputs, pads, bank_key, gestures=None):
+        self.banks = max(1, len(inputs) // pads)
+        self.bank = 0
+        self.command("load", inputs, outputs, pads, bank_key, gestures)
+
+    def update(self, index, key, messages, gesture=None):
+        self.command("update", index, key, messages, gesture)
+
+    def set_gesture_timing(self, double_tap_ms, long_press_ms):
+        self.command("set_gesture_timing", double_tap_ms, long_press_ms)
+
+    def set_thru(self, forward, stages):
+        self.command("set_thru", forward, stages)
+
+    def set_sysex_rate(self, bytes_per_second):
+        self.command("set_sysex_rate", bytes_per_second)
+
+    def set_learning(self, learning):
+        """Forward MIDI input to `input_handler` instead of routing it"""
+        self.command("set_learning", learning)
+
+    def press(self, index):
+        self.command("press", index)
+
+    def select_bank(self, bank):
+        if not 0 <= bank < self.banks:
+            return False
+        self.command("select_bank", bank)
+        return True
+
+    def step_bank(self, step):
+        self.command("step_bank", step)
+
+    def send(self, messages):
+        self.command("send", messages)
+
+    def handle_osc(self, address, args):
+        self.command("handle_osc", address, args)
+
+
+class EngineHost:
+    """The child side: owns the MIDI ports and the engine, runs commands"""
+
+    def __init__(self, conn, state, fake_midi=False, forward_input=False):
+        from midi_backend import create_midi_in, create_midi_out
+        from midi_engine import MidiEngine
+        from midi_router import MidiRouter
+
+        self.conn = conn
+        # Events are sent from the command loop and the MIDI input thread
+        self.send_lock = threading.Lock()
+        self.forward_input = forward_input
+        self.learning = False
+        self.midi_in = create_midi_in(fake_midi)
+        self.engine = MidiEngine(
+            create_midi_out(fake_midi), MidiRouter(state), osc_send=self.send_osc
+        )
+        self.engine.bank_listeners.append(self.send_bank)
+        engine = self.engine
+        self.commands = {
+            "press": engine.press,
+            "handle_osc": engine.handle_osc,
+            "select_bank": engine.select_bank,
+            "step_bank": engine.step_bank,
+            "send": engine.send,
+            "set_ports": engine.set_ports,
+            "load": engine.load,
+            "update": engine.update,
+            "set_sysex_rate": engine.set_sysex_rate,
+            "set_gesture_timing": engine.set_gesture_timing,
+            "set_thru": engine.set_thru,
+            "connect": self.connect,
+            "set_learning": self.set_learning,
+            "ping": self.ping,
+        }
+
+    def event(self, *event):
+        with self.send_lock:
+            self.conn.send(event)
+
+    def send_bank(self, bank):
+        self.event("bank", bank)
+
+    def send_osc(self, packet):
+        self.event("osc", packet)
+
+    def ping(self, token):
+        self.event("pong", token)
+
+    def set_learning(self, learning):
+        self.learning = learning
+
+    def handle_midi_input(self, midi_message, data=None):
+        message = midi_message[0]
+        if not message:
+            return
+        if self.learning:
+            self.event("input", message)
+            return
+        self.engine.handle_input(message)
+        if self.forward_input:
+            self.event("input", message)
+
+    def connect(self, input_port, output_port):
+        from midi_backend import accept_system_messages, open_port
+
+        self.engine.forget_device_state()
+        if self.midi_in.is_port_open():
+            self.midi_in.close_port()
+        midi_out = self.engine.midi_out
+        if midi_out.is_port_open():
+            midi_out.close_port()
+
+        ports = [self.engine.input_port, self.engine.output_port]
+        if input_port and open_port(self.midi_in, input_port):
+            self.midi_in.set_callback(self.handle_midi_input)
+            accept_system_messages(self.midi_in)
+            ports[0] = input_port
+        if output_port and open_port(midi_out, output_port):
+            ports[1] = output_port
+        self.engine.set_ports(*ports)
+
+    def run(self):
+        from midi_backend import delete_midi
+
+        commands = self.commands
+        while True:
+            try:
+                name, args = self.conn.recv()
+            except (EOFError, OSError):
+                break  # The UI is gone
+            if name == "stop":
+                break
+            try:
+                commands[name](*args)
+            except Exception:
+                # One bad command must not stop MIDI for the rest of the show
+                traceback.print_exc()
+        self.engine.stop()
+        delete_midi(self.midi_in)
+        delete_midi(self.engine.midi_out)
+        try:
+            self.event("stopped", self.engine.device_state.saved_sends)
+        except OSError:
+            pass
+
+
+def main(pipe_fd, state_fd):
+    from midi_worker import pin_thread, set_fifo, tune_interpreter
+
+    conn = Connection(pipe_fd)
+    options = conn.recv()
+    # Before the MIDI threads exist, so they inherit the core and priority
+    if options["core"] is not None:
+        pin_thread({options["core"]})
+    if options["fifo_priority"]:
+        set_fifo(options["fifo_priority"])
+    pads = options["pads"]
+    state = PadState(pads, mmap.mmap(state_fd, PadState.buffer_size(pads)))
+    host = EngineHost(conn, state, options["fake_midi"], options["forward_input"])
+    tune_interpreter()
+    host.run()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]), int(sys.argv[2]))
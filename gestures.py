@@ -0,0 +1,207 @@
+"""Debouncing and tap, double-tap and long-press detection for foot switches.
+
+Pads can react to a gesture on their input instead of every message. The
+pads of one input are grouped by gesture in a GestureInput, which also
+holds the input's switch state. Incoming messages are turned into switch
+edges (Note On/Off, CC at or above 64 down, below 64 up) and decided on the
+spot where possible. Decisions that depend on time (the end of a bounce,
+a held switch, a tap that wasn't followed by a second one) get a deadline
+when the edge arrives, and one thread sleeps until the earliest of them, so
+there is no timer per press.
+
+Debouncing keeps the first edge (no added latency) and ignores the input
+for `debounce` seconds after it. If the switch ended up in the other
+position when the window closes, that edge is applied then.
+"""
+import threading
+import time
+
+GESTURES = ["press", "tap", "double_tap", "long_press"]
+DOUBLE_TAP_MS = 300
+LONG_PRESS_MS = 600
+
+
+def switch_level(message):
+    """Return True (down), False (up) or None (Program Change, no release)"""
+    kind = message[0] & 0xF0
+    if kind == 0x80:
+        return False
+    if kind == 0x90:
+        return len(message) > 2 and message[2] > 0
+    if kind == 0xB0:
+        return len(message) > 2 and message[2] >= 64
+    return None
+
+
+class GestureInput:
+    """Pads of one input by gesture, and the switch state of the input"""
+
+    __slots__ = (
+        "press",
+        "tap",
+        "double_tap",
+        "long_press",
+        "debounce",
+        "level",
+        "raw",
+        "settle",
+        "long_deadline",
+        "tap_deadline",
+        "long_fired",
+        "second_press",
+    )
+
+    def __init__(self, pads, debounce=0.0):
+        """`pads` is a list of (pad index, gesture)"""
+        self.press = tuple(i for i, gesture in pads if gesture == "press")
+        self.tap = tuple(i for i, gesture in pads if gesture == "tap")
+        self.double_tap = tuple(i for i, gesture in pads if gesture == "double_tap")
+        self.long_press = tuple(i for i, gesture in pads if gesture == "long_press")
+        self.debounce = debounce
+        self.level = False  # Debounced switch position
+        self.raw = False  # Last reported position
+        self.settle = 0.0  # End of the debounce window
+        self.long_deadline = None
+        self.tap_deadline = None
+        self.long_fired = False
+        self.second_press = False
+
+    def next_deadline(self):
+        deadline = None
+        if self.raw != self.level:
+            deadline = self.settle
+        for other in (self.long_deadline, self.tap_deadline):
+            if other is not None and (deadline is None or other < deadline):
+                deadline = other
+        return deadline
+
+
+class GestureDetector:
+    """Turns switch edges into the pads to press
+
+    `fire(index)` is called from the deadline thread for timed gestures.
+    With `fire` None no thread is started, and `input` and `poll` are driven
+    with explicit times (e.g. replaying recorded switch bounce).
+    """
+
+    def __init__(self, fire, double_tap_ms=DOUBLE_TAP_MS, long_press_ms=LONG_PRESS_MS):
+        self.fire = fire
+        self.double_tap = double_tap_ms / 1000
+        self.long_press = long_press_ms / 1000
+        # Inputs waiting for a deadline
+        self.pending = set()
+        self.wakeup = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def set_times(self, double_tap_ms, long_press_ms):
+        self.double_tap = double_tap_ms / 1000
+        self.long_press = long_press_ms / 1000
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="gestures", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            with self.wakeup:
+                self.running = False
+                self.wakeup.notify()
+            self.thread.join()
+            self.thread = None
+
+    def input(self, gesture, level, now):
+        """Handle a message of an input, returning the pads to press now"""
+        with self.wakeup:
+            if level is None:
+                # No release will come, so it's a tap that can't be held
+                fired = self._level(gesture, True, now)
+                fired += self._level(gesture, False, now)
+            else:
+                fired = self._level(gesture, level, now)
+            if gesture.next_deadline() is not None:
+                self.pending.add(gesture)
+                if self.thread is None and self.fire is not None:
+                    self.start()
+                # The new deadline can be earlier than the one slept until
+                self.wakeup.notify()
+        return fired
+
+    def _level(self, gesture, level, now):
+        gesture.raw = level
+        if now < gesture.settle:
+            return ()  # Bouncing, decided when the window closes
+        return self._edge(gesture, level, now)
+
+    def _edge(self, gesture, down, now):
+        if down == gesture.level:
+            return ()  # e.g. a second CC 127 without a release
+        gesture.level = down
+        gesture.settle = now + gesture.debounce
+        if down:
+            if gesture.tap_deadline is not None:
+                # Second press within the double tap time
+                gesture.tap_deadline = None
+                gesture.second_press = True
+                return gesture.press + gesture.double_tap
+            if gesture.long_press:
+                gesture.long_deadline = now + self.long_press
+            return gesture.press
+
+        gesture.long_deadline = None
+        if gesture.second_press:
+            gesture.second_press = False
+            return ()
+        if gesture.long_fired:
+            gesture.long_fired = False
+            return ()
+        if gesture.double_tap:
+            # A tap, unless a second press follows
+            gesture.tap_deadline = now + self.double_tap
+            return ()
+        return gesture.tap
+
+    def poll(self, now):
+        """Decide every gesture whose deadline has passed, returning the pads
+        to press and the next deadline"""
+        with self.wakeup:
+            return self._poll(now)
+
+    def _poll(self, now):
+        fired = ()
+        deadline = None
+        for gesture in list(self.pending):
+            if gesture.raw != gesture.level and now >= gesture.settle:
+                fired += self._edge(gesture, gesture.raw, gesture.settle)
+            if gesture.long_deadline is not None and now >= gesture.long_deadline:
+                gesture.long_deadline = None
+                gesture.long_fired = True
+                fired += gesture.long_press
+            if gesture.tap_deadline is not None and now >= gesture.tap_deadline:
+                gesture.tap_deadline = None
+                fired += gesture.tap
+
+            next_deadline = gesture.next_deadline()
+            if next_deadline is None:
+                self.pending.discard(gesture)
+            elif deadline is None or next_deadline < deadline:
+                deadline = next_deadline
+        return fired, deadline
+
+    def run(self):
+        with self.wakeup:
+            while self.running:
+                fired, deadline = self._poll(time.perf_counter())
+                if fired:
+                    # Pressing sends MIDI, input must not wait for it
+                    self.wakeup.release()
+                    try:
+                        for index in fired:
+                            self.fire(index)
+                    finally:
+                        self.wakeup.acquire()
+                elif deadline is None:
+                    self.wakeup.wait()
+                else:
+                    self.wakeup.wait(deadline - time.perf_counter())
@@ -0,0 +1,325 @@
+"""Button mappings with per-field change tracking.
+
+Every edit goes through MappingStore.set_field, which produces a delta
+(index, field, old, new) and hands it to the registered listeners. Listeners
+update incrementally: the router patches one entry, the journal appends one
+line and the mappings table refreshes one row.
+
+Deltas are also kept in a bounded undo/redo history. Each history entry is
+a group of deltas (a MIDI learn changes several fields at once) and is
+reverted by applying the inverse deltas.
+"""
+import json
+import os
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+from config_schema import (
+    ConfigError,
+    default_mapping,
+    input_gesture,
+    input_key,
+    output_messages,
+    validate_field,
+)
+
+
+def inverse(delta):
+    index, field, old, new = delta
+    return (index, field, new, old)
+
+
+class MappingStore:
+    """Ordered button names and mappings, indexed by grid position
+
+    With several banks, bank b holds indices b * pads to (b + 1) * pads - 1.
+    """
+
+    def __init__(self, pads, history_size=200):
+        self.pads = pads
+        self.bank_names = ["Bank 1"]
+        self.names = [f"Button {i+1}" for i in range(pads)]
+        self.mappings = [default_mapping() for _ in range(pads)]
+        # Compiled runtime structures, kept in step with the mappings
+        self.inputs = [None] * pads
+        self.outputs = [()] * pads
+        self.gestures = [None] * pads
+        # Called with each delta after it has been applied
+        self.listeners = []
+
+        # Groups of deltas that can be undone/redone, oldest dropped first
+        self.history = deque(maxlen=history_size)
+        self.redo_stack = deque(maxlen=history_size)
+        self._group = None
+        # Called with ("do" | "undo" | "redo", group) for the journal
+        self.history_listeners = []
+
+    def __len__(self):
+        return len(self.mappings)
+
+    def load(self, compiled):
+        """Replace the mappings with those of a compiled config
+
+        Buttons beyond the end of a bank in the config keep their current
+        mapping. The undo history refers to the old mappings and is cleared.
+        """
+        self.history.clear()
+        self.redo_stack.clear()
+        banks = compiled["banks"]
+        self.bank_names = [bank["name"] for bank in banks]
+        self.resize(len(banks) * self.pads)
+        for number, bank in enumerate(banks):
+            start = number * self.pads
+            for i in range(min(self.pads, len(bank["names"]))):
+                self.names[start + i] = bank["names"][i]
+                self.mappings[start + i] = bank["mappings"][i]
+                self.inputs[start + i] = bank["inputs"][i]
+                self.outputs[start + i] = bank["outputs"][i]
+                self.gestures[start + i] = bank["gestures"][i]
+
+    def diff(self, compiled):
+        """Return the deltas that turn the mappings into a compiled config's
+
+        Returns None if the config has a different number of banks, which
+        needs a full `load`.
+        """
+        banks = compiled["banks"]
+        if len(banks) * self.pads != len(self):
+            return None
+        deltas = []
+        for number, bank in enumerate(banks):
+            start = number * self.pads
+            for i in range(min(self.pads, len(bank["names"]))):
+                index = start + i
+                if bank["names"][i] != self.names[index]:
+                    deltas.append((index, "name", self.names[index], bank["names"][i]))
+                mapping = self.mappings[index]
+                if bank["mappings"][i] == mapping:
+                    continue
+                for field, value in bank["mappings"][i].items():
+                    if mapping.get(field) != value:
+                        deltas.append((index, field, mapping.get(field), value))
+        return deltas
+
+    def reload(self, compiled):
+        """Apply a compiled config as deltas, so only changed buttons are
+        recompiled and reported to the listeners
+
+        Returns the deltas, or None if a full `load` is needed. The undo
+        history is cleared as on load.
+        """
+        deltas = self.diff(compiled)
+        if deltas is None:
+            return None
+        self.history.clear()
+        self.redo_stack.clear()
+        self.bank_names = [bank["name"] for bank in compiled["banks"]]
+        # Every field of a button is set before it is recompiled, a half
+        # applied button can be an invalid mapping
+        for delta in deltas:
+            self._set(delta)
+        for index in {delta[0] for delta in deltas if delta[1] != "name"}:
+            self._compile(index)
+        for delta in deltas:
+            for listener in self.listeners:
+                listener(delta)
+        return deltas
+
+    def resize(self, size):
+        del self.names[size:]
+        del self.mappings[size:]
+        del self.inputs[size:]
+        del self.outputs[size:]
+        del self.gestures[size:]
+        for i in range(len(self), size):
+            self.names.append(f"Button {i % self.pads + 1}")
+            self.mappings.append(default_mapping())
+            self.inputs.append(None)
+            self.outputs.append(())
+            self.gestures.append(None)
+
+    def bank(self, number):
+        """Return the (names, mappings) of one bank"""
+        start = number * self.pads
+        end = start + self.pads
+        return self.names[start:end], self.mappings[start:end]
+
+    def get(self, index, field):
+        if field == "name":
+            return self.names[index]
+        return self.mappings[index][field]
+
+    def set_field(self, index, field, value):
+        """Validate and apply an edit, returning the delta or None if unchanged
+
+        Raises ConfigError (a ValueError) if the value is invalid.
+        """
+        if field == "name":
+            value = value.strip() if isinstance(value, str) else value
+            if not value or not isinstance(value, str):
+                raise ConfigError(["button.name: a name is required"])
+            # Names are unique within a bank
+            bank_names = self.bank(index // self.pads)[0]
+            if value != self.names[index] and value in bank_names:
+                raise ConfigError([f"button.name: {value!r} is already used"])
+        else:
+            value = validate_field(field, value)
+
+        old = self.get(index, field)
+        if old == value:
+            return None
+        delta = (index, field, old, value)
+        self.apply(delta)
+        if self._group is not None:
+            self._group.append(delta)
+        else:
+            self._push((delta,))
+        return delta
+
+    @contextmanager
+    def group(self):
+        """Record every edit made inside the block as one undo step"""
+        self._group = []
+        try:
+            yield
+        finally:
+            group, self._group = tuple(self._group), None
+            if group:
+                self._push(group)
+
+    def _push(self, group):
+        self.history.append(group)
+        self.redo_stack.clear()
+        self._notify_history("do", group)
+
+    def _notify_history(self, op, group):
+        for listener in self.history_listeners:
+            listener(op, group)
+
+    def undo(self):
+        """Revert the last edit, returning its group or None"""
+        if not self.history:
+            return None
+        group = self.history.pop()
+        for delta in reversed(group):
+            self.apply(inverse(delta))
+        self.redo_stack.append(group)
+        self._notify_history("undo", group)
+        return group
+
+    def redo(self):
+        """Reapply the last undone edit, returning its group or None"""
+        if not self.redo_stack:
+            return None
+        group = self.redo_stack.pop()
+        for delta in group:
+            self.apply(delta)
+        self.history.append(group)
+        self._notify_history("redo", group)
+        return group
+
+    def replay(self, entry):
+        """Reapply one journal entry
+
+        Deltas carry absolute values, so replaying entries that are already
+        part of the snapshot leaves the same end state.
+        """
+        op = entry[0]
+        if op == "history":
+            self.history.clear()
+            self.history.extend(_groups(entry[1]))
+            self.redo_stack.clear()
+            self.redo_stack.extend(_groups(entry[2]))
+        elif op == "do":
+            group = _groups([entry[1]])[0]
+            for delta in group:
+                self.apply(delta)
+            self.history.append(group)
+            self.redo_stack.clear()
+        elif op == "undo":
+            self.undo()
+        elif op == "redo":
+            self.redo()
+
+    def apply(self, delta):
+        """Apply a delta and notify listeners"""
+        self._set(delta)
+        if delta[1] != "name":
+            # Only the edited button is recompiled
+            self._compile(delta[0])
+
+        for listener in self.listeners:
+            listener(delta)
+
+    def _set(self, delta):
+        index, field, _, new = delta
+        if field == "name":
+            self.names[index] = new
+        else:
+            self.mappings[index][field] = new
+
+    def _compile(self, index):
+        mapping = self.mappings[index]
+        self.inputs[index] = input_key(mapping)
+        self.outputs[index] = output_messages(mapping)
+        self.gestures[index] = input_gesture(mapping)
+
+
+def _groups(raw):
+    """Convert JSON lists back into groups of delta tuples"""
+    return [tuple(tuple(delta) for delta in group) for group in raw]
+
+
+class MappingJournal:
+    """Append-only log of history operations on top of a config snapshot
+
+    Each line is ["do", group], ["undo"] or ["redo"]. Compaction writes a
+    fresh snapshot and replaces the journal by a single ["history", undo,
+    redo] line, so the undo history survives restarts and crashes. The owner
+    compacts once `needs_compaction` is true.
+    """
+
+    def __init__(self, path, compact_every=100):
+        self.path = Path(path)
+        self.compact_every = compact_every
+        self.entries = 0
+
+    @property
+    def needs_compaction(self):
+        return self.entries >= self.compact_every
+
+    def append(self, op, group):
+        # undo/redo always act on the top of a stack, the group is implied
+        entry = [op, group] if op == "do" else [op]
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.entries += 1
+
+    def read(self):
+        """Return the entries recorded since the last compaction"""
+        entries = []
+        if not self.path.exists():
+            return entries
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash can leave a partial last line behind
+                    print(f"Skipping damaged journal entry: {line!r}")
+        self.entries = len(entries)
+        return entries
+
+    def rewrite(self, history, redo_stack):
+        """Replace the journal by the current undo/redo history"""
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            f.write(json.dumps(["history", list(history), list(redo_stack)]) + "\n")
+        os.replace(temp_path, self.path)
+        self.entries = 0
+
+    def truncate(self):
+        if self.path.exists():
+            self.path.unlink()
+        self.entries = 0
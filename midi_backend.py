@@ -0,0 +1,115 @@
+"""MIDI port objects, real (python-rtmidi) or fake.
+
+The fake ports have the same interface as the rtmidi ones and need no MIDI
+hardware or drivers. They are used by the benchmarks and by `--fake-midi`.
+"""
+from collections import deque
+
+FAKE_PORT = "Fake MIDI Port"
+
+# MIDI clients created and not deleted yet, each one holds a connection to
+# the system MIDI service
+_open_clients = 0
+
+
+def create_midi_in(fake=False):
+    global _open_clients
+    _open_clients += 1
+    if fake:
+        return FakeMidiIn()
+    import rtmidi
+
+    return rtmidi.RtMidiIn()
+
+
+def create_midi_out(fake=False):
+    global _open_clients
+    _open_clients += 1
+    if fake:
+        return FakeMidiOut()
+    import rtmidi
+
+    return rtmidi.RtMidiOut()
+
+
+def delete_midi(client):
+    """Close a client's port and release it"""
+    global _open_clients
+    if client.is_port_open():
+        client.close_port()
+    if hasattr(client, "delete"):
+        client.delete()
+    _open_clients -= 1
+
+
+def open_clients():
+    return _open_clients
+
+
+def open_port(client, name):
+    """Open the port called `name`, returning False if there is none"""
+    ports = client.get_ports()
+    if name not in ports:
+        return False
+    client.open_port(ports.index(name))
+    return True
+
+
+def accept_system_messages(midi_in):
+    """Receive SysEx, clock and start/stop, which rtmidi drops by default,
+    so MIDI thru can forward them (active sensing stays filtered)"""
+    if hasattr(midi_in, "ignore_types"):
+        midi_in.ignore_types(sysex=False, timing=False, active_sense=True)
+
+
+class FakeMidiPort:
+    def __init__(self):
+        self.port_open = False
+
+    def get_ports(self):
+        return [FAKE_PORT]
+
+    def open_port(self, port=0, name=None):
+        self.port_open = True
+
+    def close_port(self):
+        self.port_open = False
+
+    def is_port_open(self):
+        return self.port_open
+
+    def delete(self):
+        self.close_port()
+
+
+class FakeMidiIn(FakeMidiPort):
+    def __init__(self):
+        super().__init__()
+        self.callback = None
+        self.data = None
+
+    def set_callback(self, callback, data=None):
+        self.callback = callback
+        self.data = data
+
+    def cancel_callback(self):
+        self.callback = None
+
+    def inject(self, message, delta_time=0.0):
+        """Deliver a message as if it came from the port"""
+        if self.callback is not None:
+            self.callback((message, delta_time), self.data)
+
+
+class FakeMidiOut(FakeMidiPort):
+    def __init__(self, keep=1000):
+        super().__init__()
+        # The most recent messages, older ones only show up in the counters
+        self.sent = deque(maxlen=keep)
+        self.message_count = 0
+        self.byte_count = 0
+
+    def send_message(self, message):
+        self.sent.append(message)
+        self.message_count += 1
+        self.byte_count += len(message)
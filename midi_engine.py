@@ -0,0 +1,224 @@
+"""Routing engine shared by every source of events.
+
+Touch presses, incoming MIDI and OSC, and the control server all end up
+here. The engine turns them into output messages using the router tables
+and the device state cache, without depending on Qt.
+"""
+import threading
+import time
+
+from device_state import DeviceStateCache, state_key
+from gestures import GestureDetector, switch_level
+from midi_router import BankSwitch, MidiRouter
+from midi_thru import compile_thru
+from osc import OscPacket
+from sysex import SysexDump, SysexSender
+
+
+class MidiEngine:
+    def __init__(self, midi_out, router=None, device_state=None, osc_send=None):
+        self.midi_out = midi_out
+        # Called with each OscPacket of an output, e.g. OscBridge.send
+        self.osc_send = osc_send
+        self.router = router or MidiRouter()
+        self.device_state = device_state or DeviceStateCache()
+        self.input_port = None
+        self.output_port = None
+        # Sends can come from the GUI, the MIDI input and the control server
+        self.send_lock = threading.Lock()
+        # Large SysEx dumps are sent in paced chunks on their own thread
+        self.sysex_sender = SysexSender(self.send_message)
+        # Called with the bank number after a bank switch, on any thread
+        self.bank_listeners = []
+        # Taps, double taps and long presses of inputs with gestures
+        self.gestures = GestureDetector(self.press)
+        # Compiled thru pipeline, None when input isn't forwarded
+        self.thru = None
+        self.thru_all = False
+
+    def set_ports(self, input_port, output_port):
+        self.input_port = input_port
+        self.output_port = output_port
+
+    @property
+    def bank(self):
+        return self.router.bank
+
+    @property
+    def saved_sends(self):
+        return self.device_state.saved_sends
+
+    def load(self, inputs, outputs, pads, bank_key, gestures=None):
+        """Swap in freshly compiled routing tables and show the first bank"""
+        self.router.load(inputs, outputs, pads, gestures)
+        self.router.bank_key = bank_key
+        self.select_bank(0)
+
+    def update(self, index, key, messages, gesture=None):
+        """Patch the routing entry of a single button (index over all banks)"""
+        self.router.update(index, key, messages, gesture)
+
+    def set_gesture_timing(self, double_tap_ms, long_press_ms):
+        self.gestures.set_times(double_tap_ms, long_press_ms)
+
+    def set_thru(self, forward, stages):
+        """Compile the thru pipeline
+
+        `forward` is "off", "unmapped" (input no pad uses) or "all".
+        """
+        self.thru = None if forward == "off" else compile_thru(stages)
+        self.thru_all = forward == "all"
+
+    def set_sysex_rate(self, bytes_per_second):
+        self.sysex_sender.bytes_per_second = bytes_per_second
+
+    def forget_device_state(self):
+        """Forget what the devices hold, e.g. before ports are reopened"""
+        self.device_state.clear()
+        self.sync_latched()
+
+    def sync_latched(self):
+        """Recompute every pad's latched state from the known device state"""
+        state = self.router.state
+        if state is None:
+            return
+        for index in range(state.size):
+            state.set_latched(index, 0)
+        for (port, key), value in list(self.device_state.values.items()):
+            if port == self.output_port:
+                self.router.feedback(key, value)
+
+    def stop(self):
+        self.sysex_sender.stop()
+        self.gestures.stop()
+
+    def press(self, index):
+        """Send the output of a pad"""
+        messages = self.router.press(index)
+        port_open = self.midi_out.is_port_open()
+        switch = None
+        with self.send_lock:
+            for message in messages:
+                if type(message) is BankSwitch:
+                    switch = message
+                elif type(message) is OscPacket:
+                    if self.osc_send is not None:
+                        self.osc_send(message)
+                elif type(message) is SysexDump:
+                    if port_open:
+                        self.sysex_sender.queue(message)
+                # Skip values the device is known to hold already
+                elif port_open and self.device_state.should_send(
+                    self.output_port, message
+                ):
+                    self.midi_out.send_message(message)
+        if port_open:
+            self.router.latch(index)
+        if switch is not None:
+            if switch.step:
+                self.step_bank(switch.step)
+            else:
+                self.select_bank(switch.bank)
+
+    def select_bank(self, bank):
+        """Switch the pads to another bank, returning False if it doesn't exist"""
+        if not self.router.select(bank):
+            return False
+        self.sync_latched()
+        for listener in self.bank_listeners:
+            listener(bank)
+        return True
+
+    def step_bank(self, step):
+        """Switch `step` banks forward or back, wrapping around"""
+        return self.select_bank((self.router.bank + step) % len(self.router.banks))
+
+    def send_message(self, message):
+        """Send one message as is, e.g. part of a SysEx dump"""
+        with self.send_lock:
+            if self.midi_out.is_port_open():
+                self.midi_out.send_message(message)
+
+    def send(self, messages):
+        """Send raw messages, e.g. from the control server"""
+        if not self.midi_out.is_port_open():
+            return
+        with self.send_lock:
+            for message in messages:
+                if self.device_state.should_send(self.output_port, message):
+                    self.midi_out.send_message(message)
+        for message in messages:
+            key, value = state_key(message)
+            if key is not None:
+                self.router.feedback(key, value)
+
+    def handle_input(self, message):
+        """Route an incoming message, returning the pads it triggered"""
+        if len(message) < 2:
+            # Clock, start/stop, ...: no pad uses them, only thru does
+            if self.thru is not None:
+                self.forward(message)
+            return ()
+
+        # Track device feedback, e.g. a preset changed on the unit itself
+        change = self.device_state.receive(self.input_port, message)
+        if change and self.input_port == self.output_port:
+            self.router.feedback(*change)
+
+        bank = self.router.bank_select(message)
+        if bank is not None:
+            self.select_bank(bank)
+            indices = ()
+            mapped = True
+        else:
+            indices, mapped = self.route_input(message)
+        if self.thru is not None and (self.thru_all or not mapped):
+            self.forward(message)
+        return indices
+
+    def route_input(self, message):
+        """Press the pads of a message, returning (pads pressed, whether any
+        pad uses the message)"""
+        if message[1] > 127:
+            return (), False  # e.g. an empty SysEx, [0xF0, 0xF7]
+        table = self.router.table
+        if table.gesture_table is not None:
+            gesture = table.gesture_table[message[0] >> 4][message[1]]
+            if gesture is not None:
+                # Values are still shown, presses depend on the gesture
+                self.router.route(message)
+                indices = self.gestures.input(
+                    gesture, switch_level(message), time.perf_counter()
+                )
+                for index in indices:
+                    self.press(index)
+                return indices, True
+
+        indices = self.router.route(message)
+        for index in indices:
+            self.press(index)
+        if indices:
+            return indices, True
+        # The Note Off of a note input belongs to the pads too
+        return indices, bool(
+            message[0] & 0xF0 == 0x80 and table.input_table[0x9][message[1]]
+        )
+
+    def forward(self, message):
+        """Send an input message through the thru pipeline to the output"""
+        message = self.thru(message)
+        if message is None or not self.midi_out.is_port_open():
+            return
+        with self.send_lock:
+            self.midi_out.send_message(message)
+        # Forwarded values change what the device holds, like our own sends
+        key, value = self.device_state.sent(self.output_port, message)
+        if key is not None:
+            self.router.feedback(key, value)
+
+    def handle_osc(self, address, args):
+        """Route an incoming OSC message, returning the pads it triggered"""
+        indices = self.router.route_osc(address, args)
+        for index in indices:
+            self.press(index)
+        return indices
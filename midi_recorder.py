@@ -0,0 +1,140 @@
+"""Recording and replay of MIDI input and pad presses.
+
+The recorder appends timestamped events to a compact binary log. The live
+path only appends a tuple to a deque; packing and writing happen on a
+background thread. Replaying a log feeds the events back through a
+MidiEngine at the recorded pace, N times faster or as fast as possible, for
+soak tests that look for latency drift and memory growth.
+
+Log format: a sequence of records, each a little endian header (seconds
+since the session start as a double, kind as a byte, payload length as a
+uint32 so SysEx of any size fits) followed by the payload. Every session
+starts with a SESSION record whose payload is the wall clock start time, so
+several sessions can be appended to one file.
+"""
+import struct
+import threading
+import time
+from collections import deque
+
+MIDI = 0  # Payload: the message bytes
+PRESS = 1  # Payload: pad index as uint16
+SESSION = 255  # Payload: wall clock time as a double
+
+_HEADER = struct.Struct("<dBI")
+_INDEX = struct.Struct("<H")
+_WALL_TIME = struct.Struct("<d")
+
+
+class MidiRecorder:
+    """Appends MIDI input and pad presses to a log file"""
+
+    def __init__(self, path, flush_interval=0.5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = deque()
+        self.file = None
+        self.thread = None
+        self.running = threading.Event()
+        self.start_time = None
+        self.events_written = 0
+
+    def start(self):
+        self.file = open(self.path, "ab")
+        self.start_time = time.perf_counter()
+        self.file.write(_HEADER.pack(0.0, SESSION, _WALL_TIME.size))
+        self.file.write(_WALL_TIME.pack(time.time()))
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.running.clear()
+            self.thread.join()
+            self.thread = None
+            self.write_pending()
+            self.file.close()
+
+    def record_midi(self, message):
+        """Record an incoming message (MIDI input thread)"""
+        # Packed later on the writer thread, rtmidi passes a new list each time
+        self.pending.append((time.perf_counter(), MIDI, message))
+
+    def record_press(self, index):
+        """Record a pad press"""
+        self.pending.append((time.perf_counter(), PRESS, index))
+
+    def run(self):
+        while self.running.is_set():
+            time.sleep(self.flush_interval)
+            self.write_pending()
+
+    def write_pending(self):
+        chunks = []
+        pending = self.pending
+        start = self.start_time
+        while pending:
+            timestamp, kind, data = pending.popleft()
+            payload = _INDEX.pack(data) if kind == PRESS else bytes(data)
+            chunks.append(_HEADER.pack(timestamp - start, kind, len(payload)))
+            chunks.append(payload)
+        if chunks:
+            self.file.write(b"".join(chunks))
+            self.file.flush()
+            self.events_written += len(chunks) // 2
+
+
+def read_log(path):
+    """Return the recorded events as (seconds, kind, message or pad index)
+
+    Times continue across sessions, each session starting where the
+    previous one ended. A record cut off by a crash ends the log.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    events = []
+    offset = 0
+    base = 0.0
+    last = 0.0
+    while offset + _HEADER.size <= len(data):
+        timestamp, kind, length = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        payload = data[offset : offset + length]
+        if len(payload) < length:
+            break
+        offset += length
+        if kind == SESSION:
+            base = last
+        elif kind == PRESS:
+            events.append((base + timestamp, PRESS, _INDEX.unpack(payload)[0]))
+        elif kind == MIDI:
+            events.append((base + timestamp, MIDI, list(payload)))
+        last = base + timestamp
+    return events
+
+
+def replay(events, engine, speed=1.0, on_event=None):
+    """Feed recorded events through an engine, returning the dispatch delays
+
+    `speed` scales the recorded pace, 0 replays as fast as possible. Each
+    delay is how late the event was handled (in ms), including the time the
+    engine took. `on_event(number)` is called after each event.
+    """
+    delays = []
+    start = time.perf_counter()
+    for number, (timestamp, kind, data) in enumerate(events):
+        due = start + timestamp / speed if speed else time.perf_counter()
+        wait = due - time.perf_counter()
+        if wait > 0.002:
+            time.sleep(wait - 0.001)
+        while time.perf_counter() < due:
+            pass  # sleep() alone oversleeps by up to a scheduler tick
+        if kind == MIDI:
+            engine.handle_input(data)
+        else:
+            engine.press(data)
+        delays.append((time.perf_counter() - due) * 1000)
+        if on_event is not None:
+            on_event(number)
+    return delays
@@ -0,0 +1,272 @@
+"""Routing tables built from the compiled button mappings.
+
+Each bank has its own precompiled tables. Switching banks swaps the active
+table, nothing is rebuilt.
+"""
+from device_state import state_key
+from gestures import GestureInput
+from osc import osc_value
+from pad_state import NO_VALUE
+
+
+class BankSwitch:
+    """Output that switches banks instead of sending a message
+
+    Switches to `bank`, or `step` banks forward or back (wrapping around).
+    """
+
+    __slots__ = ("bank", "step")
+
+    def __init__(self, bank=None, step=0):
+        self.bank = bank
+        self.step = step
+
+    def __eq__(self, other):
+        return (
+            type(other) is BankSwitch
+            and self.bank == other.bank
+            and self.step == other.step
+        )
+
+    def __hash__(self):
+        return hash((self.bank, self.step))
+
+
+def latch_key(messages):
+    """Return ((status, number), value) a pad's output leaves on the device
+
+    Only CC and Program Change outputs latch, notes are momentary.
+    """
+    if (
+        messages
+        and type(messages[-1]) is list
+        and messages[-1][0] & 0xF0 in (0xB0, 0xC0)
+    ):
+        return state_key(messages[-1])
+    return None, None
+
+
+def _index_add(index, key, item):
+    index[key] = index.get(key, ()) + (item,)
+
+
+def _index_remove(index, key, item):
+    remaining = tuple(i for i in index[key] if i != item)
+    if remaining:
+        index[key] = remaining
+    else:
+        del index[key]
+
+
+def _input_table(input_index):
+    """Build the [status >> 4][number] -> indices table for MIDI inputs"""
+    table = [[()] * 128 for _ in range(16)]
+    for key, indices in input_index.items():
+        if key[0] != "osc":
+            table[key[0] >> 4][key[1]] = indices
+    return table
+
+
+class RoutingTable:
+    """Routing tables of one bank, indexed by pad"""
+
+    def __init__(self, inputs, outputs, gestures=None):
+        # (status, number) or ("osc", address) -> tuple of pad indices
+        self.input_index = {}
+        for i, key in enumerate(inputs):
+            if key is not None:
+                _index_add(self.input_index, key, i)
+        # The MIDI part of input_index as nested lists, so matching a
+        # message needs no key tuple (no allocation on the input path)
+        self.input_table = _input_table(self.input_index)
+        # pad index -> (status, number) key it is indexed under
+        self.inputs = list(inputs)
+        # pad index -> tuple of precompiled messages
+        self.outputs = list(outputs)
+        # (status, number) -> ((pad index, value that latches it), ...)
+        self.latch_index = {}
+        for i, messages in enumerate(outputs):
+            key, value = latch_key(messages)
+            if key is not None:
+                _index_add(self.latch_index, key, (i, value))
+        # pad index -> (gesture, debounce) or None for a plain press
+        self.gestures = list(gestures) if gestures else [None] * len(self.inputs)
+        # [status >> 4][number] -> GestureInput, for MIDI inputs with a
+        # gesture or debounce on one of their pads. None if there are none,
+        # so plain configs skip the gesture layer with a single check.
+        self.gesture_table = None
+        for key in self.input_index:
+            self.update_gesture(key)
+
+    def update(self, index, key, messages, gesture=None):
+        """Patch the entry of a single pad, returning True if its latch changed"""
+        old_key = self.inputs[index]
+        old_gesture = self.gestures[index]
+        self.gestures[index] = gesture
+        if old_key != key:
+            if old_key is not None:
+                _index_remove(self.input_index, old_key, index)
+                self.update_table(old_key)
+                self.update_gesture(old_key)
+            if key is not None:
+                _index_add(self.input_index, key, index)
+                self.update_table(key)
+            self.inputs[index] = key
+        if key is not None and (old_key != key or old_gesture != gesture):
+            self.update_gesture(key)
+
+        old_latch = latch_key(self.outputs[index])
+        new_latch = latch_key(messages)
+        self.outputs[index] = messages
+        if old_latch == new_latch:
+            return False
+        if old_latch[0] is not None:
+            _index_remove(self.latch_index, old_latch[0], (index, old_latch[1]))
+        if new_latch[0] is not None:
+            _index_add(self.latch_index, new_latch[0], (index, new_latch[1]))
+        return True
+
+    def update_table(self, key):
+        if key[0] != "osc":
+            self.input_table[key[0] >> 4][key[1]] = self.input_index.get(key, ())
+
+    def update_gesture(self, key):
+        """Rebuild the GestureInput of one input (its switch state is reset)"""
+        if key[0] == "osc":
+            return
+        indices = self.input_index.get(key, ())
+        gestures = [self.gestures[i] for i in indices]
+        gesture = None
+        if any(gestures):
+            gesture = GestureInput(
+                [(i, g[0] if g else "press") for i, g in zip(indices, gestures)],
+                max(g[1] for g in gestures if g),
+            )
+        elif self.gesture_table is None:
+            return
+        if self.gesture_table is None:
+            self.gesture_table = [[None] * 128 for _ in range(16)]
+        self.gesture_table[key[0] >> 4][key[1]] = gesture
+        if key[0] >> 4 == 0x9:
+            # Note Off releases the switch
+            self.gesture_table[0x8][key[1]] = gesture
+
+
+class MidiRouter:
+    """Maps incoming messages to buttons and buttons to outgoing messages"""
+
+    def __init__(self, state=None):
+        # Optional PadState that presses and incoming values are written to
+        self.state = state
+        self.banks = [RoutingTable([], [])]
+        self.bank = 0
+        # Tables of the active bank, the only thing a switch replaces
+        self.table = self.banks[0]
+        self.pads = 1
+        # (status, number) of bank select messages, number None for PC
+        self.bank_key = None
+
+    def load(self, inputs, outputs, pads=None, gestures=None):
+        """Replace the routing tables with freshly compiled ones
+
+        `inputs`, `outputs` and `gestures` hold `pads` entries per bank, one
+        bank after the other. The active bank is kept if it still exists.
+        """
+        pads = pads or len(inputs) or 1
+        gestures = gestures or [None] * len(inputs)
+        banks = [
+            RoutingTable(
+                inputs[start : start + pads],
+                outputs[start : start + pads],
+                gestures[start : start + pads],
+            )
+            for start in range(0, len(inputs), pads)
+        ] or [RoutingTable([], [])]
+        bank = self.bank if self.bank < len(banks) else 0
+        # Swap in whole tables so a concurrent lookup never sees a partial update
+        self.pads = pads
+        self.banks = banks
+        self.bank = bank
+        self.table = banks[bank]
+
+    def update(self, index, key, messages, gesture=None):
+        """Patch the routing entry of a single button (index over all banks)"""
+        bank, pad = divmod(index, self.pads)
+        table = self.banks[bank]
+        if table.update(pad, key, messages, gesture) and table is self.table:
+            if self.state is not None:
+                self.state.set_latched(pad, 0)
+
+    def select(self, bank):
+        """Make a bank active, returning False if there is no such bank"""
+        if not 0 <= bank < len(self.banks):
+            return False
+        self.table = self.banks[bank]
+        self.bank = bank
+        if self.state is not None:
+            # Values and latches shown on the pads belonged to the old bank
+            for pad in range(self.pads):
+                self.state.set_value(pad, NO_VALUE)
+                self.state.set_latched(pad, 0)
+        return True
+
+    def bank_select(self, message):
+        """Return the bank an incoming message selects, or None"""
+        key = self.bank_key
+        if key is None or message[0] & 0xF0 != key[0]:
+            return None
+        if key[1] is None:
+            return message[1]  # Program Change
+        if message[1] == key[1] and len(message) > 2:
+            return message[2]
+        return None
+
+    def match(self, message):
+        """Return the indices of the buttons triggered by a message"""
+        # Ignore the channel nibble, inputs match on any channel
+        return self.table.input_table[message[0] >> 4][message[1]]
+
+    def route(self, message):
+        """Match a message and record CC values for the pad display"""
+        indices = self.match(message)
+        if indices and self.state is not None and len(message) > 2:
+            if message[0] & 0xF0 == 0xB0:
+                for index in indices:
+                    self.state.set_value(index, message[2])
+        return indices
+
+    def route_osc(self, address, args):
+        """Match an OSC message and record its value for the pad display"""
+        indices = self.table.input_index.get(("osc", address), ())
+        if indices and self.state is not None:
+            value = osc_value(args)
+            if value is not None:
+                for index in indices:
+                    self.state.set_value(index, value)
+        return indices
+
+    def messages(self, index):
+        """Return the messages to send for a button press"""
+        outputs = self.table.outputs
+        if index < len(outputs):
+            return outputs[index]
+        return ()
+
+    def feedback(self, key, value):
+        """Update the latched state of pads whose output target changed"""
+        if self.state is None:
+            return
+        for index, latch_value in self.table.latch_index.get(key, ()):
+            self.state.set_latched(index, value == latch_value)
+
+    def latch(self, index):
+        """Mark the output of a pad as sent, latching it and its neighbours"""
+        key, value = latch_key(self.messages(index))
+        if key is not None:
+            self.feedback(key, value)
+
+    def press(self, index):
+        """Record a button press and return the messages to send"""
+        if self.state is not None:
+            self.state.trigger(index)
+        return self.messages(index)
@@ -0,0 +1,147 @@
+"""MIDI thru: forwarding input to the output port through a pipeline.
+
+The pipeline is a list of stages, applied in order:
+
+    {"types": ["note", "cc"]}        pass only these message types
+    {"channel": 10}                  move every channel to channel 10
+    {"channel_map": {"1": 2, "3": null}}  move or drop (null) channels
+    {"transpose": -12}               transpose notes, dropping those out of range
+    {"cc_map": {"1": 11, "64": null}}     renumber or drop (null) CCs
+
+Stages only change the status byte or the note/CC number, so the whole
+pipeline is folded into three lookup tables when the config is loaded
+(status byte -> new status, note -> note, CC -> CC) and a message is
+forwarded by one function with at most two lookups, whatever the number
+of stages.
+"""
+
+# Message type -> high nibbles of its status bytes
+THRU_TYPES = {
+    "note": (0x8, 0x9),
+    "poly_aftertouch": (0xA,),
+    "cc": (0xB,),
+    "pc": (0xC,),
+    "aftertouch": (0xD,),
+    "pitchbend": (0xE,),
+    "system": (0xF,),  # SysEx, clock, start/stop, ...
+}
+
+
+def _number_map(raw, stage):
+    """Parse a {"number": number or null} JSON object into a dict"""
+    if not isinstance(raw, dict):
+        raise ValueError(f"{stage}: expected an object, got {raw!r}")
+    mapping = {}
+    for key, value in raw.items():
+        try:
+            number = int(key)
+        except ValueError:
+            raise ValueError(f"{stage}: {key!r} is not a number")
+        for n in (number, value):
+            if n is not None and (
+                not isinstance(n, int) or isinstance(n, bool) or not 0 <= n <= 127
+            ):
+                raise ValueError(f"{stage}: {n!r} is outside 0-127")
+        mapping[number] = value
+    return mapping
+
+
+def _channel(value, stage):
+    if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= 16:
+        raise ValueError(f"{stage}: channel {value!r} is outside 1-16")
+    return value - 1
+
+
+def _channel_map(raw, stage):
+    """Parse a {"channel": channel or null} object into 0-based channels"""
+    if not isinstance(raw, dict):
+        raise ValueError(f"{stage}: expected an object, got {raw!r}")
+    channels = {}
+    for key, value in raw.items():
+        try:
+            channel = int(key)
+        except ValueError:
+            raise ValueError(f"{stage}: {key!r} is not a channel")
+        target = None if value is None else _channel(value, stage)
+        channels[_channel(channel, stage)] = target
+    return channels
+
+
+def compile_tables(stages):
+    """Fold the stages into (status table, note table, CC table)
+
+    Raises ValueError if a stage is invalid.
+    """
+    if not isinstance(stages, list):
+        raise ValueError(f"expected a list of stages, got {stages!r}")
+    status_table = list(range(256))
+    note_table = list(range(128))
+    cc_table = list(range(128))
+
+    for number, stage in enumerate(stages):
+        name = f"stage {number + 1}"
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise ValueError(f"{name}: expected an object with one key, got {stage!r}")
+        kind, value = next(iter(stage.items()))
+
+        if kind == "types":
+            if not isinstance(value, list) or not all(t in THRU_TYPES for t in value):
+                raise ValueError(f"{name}: types must be a list of {list(THRU_TYPES)}")
+            allowed = {nibble for t in value for nibble in THRU_TYPES[t]}
+            status_table = [
+                s if s is not None and s >> 4 in allowed else None
+                for s in status_table
+            ]
+        elif kind in ("channel", "channel_map"):
+            if kind == "channel":
+                target = _channel(value, name)
+                channels = {c: target for c in range(16)}
+            else:
+                channels = _channel_map(value, name)
+            for i, s in enumerate(status_table):
+                # System messages have no channel
+                if s is not None and s < 0xF0 and (s & 0x0F) in channels:
+                    channel = channels[s & 0x0F]
+                    status_table[i] = None if channel is None else s & 0xF0 | channel
+        elif kind == "transpose":
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f"{name}: transpose must be a number of semitones")
+            note_table = [
+                n + value if n is not None and 0 <= n + value <= 127 else None
+                for n in note_table
+            ]
+        elif kind == "cc_map":
+            numbers = _number_map(value, name)
+            cc_table = [
+                numbers.get(n, n) if n is not None else None for n in cc_table
+            ]
+        else:
+            raise ValueError(f"{name}: unknown stage {kind!r}")
+    return status_table, note_table, cc_table
+
+
+def compile_thru(stages):
+    """Build the function that maps a message to the one to forward, or None"""
+    status_table, note_table, cc_table = compile_tables(stages)
+    # Number table per status nibble, None where the data is passed as is
+    number_tables = [None] * 16
+    if note_table != list(range(128)):
+        number_tables[0x8] = number_tables[0x9] = number_tables[0xA] = note_table
+    if cc_table != list(range(128)):
+        number_tables[0xB] = cc_table
+
+    def thru(message):
+        status = status_table[message[0]]
+        if status is None:
+            return None
+        numbers = number_tables[status >> 4]
+        if numbers is None or len(message) < 2:
+            if status == message[0]:
+                return message
+            return [status, *message[1:]]
+        number = numbers[message[1]]
+        if number is None:
+            return None
+        return [status, number, *message[2:]]
+
+    return thru
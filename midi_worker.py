@@ -0,0 +1,111 @@
+"""Dedicated MIDI dispatch thread for the real-time run mode.
+
+In the default mode MIDI input is handled on the rtmidi callback thread and
+touch presses on the GUI thread. With `--realtime` both are queued to one
+worker thread instead, which can be pinned to its own core and given
+SCHED_FIFO priority, so Qt repaints on the other cores don't delay it.
+The interpreter is tuned too: the heap that exists after startup is frozen
+out of the garbage collector and threads hand over the GIL more often.
+"""
+import gc
+import os
+import queue
+import sys
+import threading
+import traceback
+
+# Seconds a thread holds the GIL before others get a turn (default 0.005)
+REALTIME_SWITCH_INTERVAL = 0.0005
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_thread(cores):
+    """Restrict the calling thread to the given cores, returning success"""
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(0, cores)
+        return True
+    except OSError as e:
+        print(f"Could not set CPU affinity {sorted(cores)}: {e}")
+        return False
+
+
+def set_fifo(priority):
+    """Give the calling thread SCHED_FIFO priority, returning success
+
+    Needs root or CAP_SYS_NICE (or an rtprio limit in limits.conf).
+    """
+    if not hasattr(os, "SCHED_FIFO"):
+        return False
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        return True
+    except (OSError, PermissionError) as e:
+        print(f"SCHED_FIFO not permitted, using normal scheduling: {e}")
+        return False
+
+
+def tune_interpreter():
+    """Keep GC pauses and GIL waits short once startup is done"""
+    gc.collect()
+    # Objects alive now (Qt wrappers, configs, routing tables) are never
+    # scanned again, so collections only walk what was allocated since
+    gc.freeze()
+    sys.setswitchinterval(REALTIME_SWITCH_INTERVAL)
+
+
+class MidiWorker:
+    """Runs queued (handler, argument) calls on one thread
+
+    `core` pins the thread, `fifo_priority` (1-99) requests SCHED_FIFO.
+    """
+
+    def __init__(self, core=None, fifo_priority=0):
+        self.core = core
+        self.fifo_priority = fifo_priority
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.pinned = False
+        self.fifo = False
+
+    def start(self):
+        ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, args=(ready,), name="midi-worker", daemon=True
+        )
+        self.thread.start()
+        ready.wait()
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put((None, None))
+            self.thread.join()
+            self.thread = None
+
+    def put(self, handler, argument):
+        """Queue handler(argument), callable from any thread"""
+        self.queue.put((handler, argument))
+
+    def run(self, ready):
+        if self.core is not None:
+            self.pinned = pin_thread({self.core})
+        if self.fifo_priority:
+            self.fifo = set_fifo(self.fifo_priority)
+        ready.set()
+
+        get = self.queue.get
+        while True:
+            handler, argument = get()
+            if handler is None:
+                break
+            try:
+                handler(argument)
+            except Exception:
+                # One bad message must not stop MIDI for the rest of the show
+                traceback.print_exc()
@@ -0,0 +1,180 @@
+"""OSC (Open Sound Control) over UDP.
+
+Pads can use OSC addresses as inputs and outputs next to MIDI messages.
+Outgoing messages are encoded once when the mapping is compiled (as
+OscPacket) and incoming packets are dispatched through the same routing
+engine as MIDI input.
+"""
+import socket
+import struct
+import threading
+import traceback
+
+
+class OscPacket(bytes):
+    """Pre-encoded OSC packet, sent over UDP instead of to the MIDI port"""
+
+
+def _pad(data):
+    """Null terminate and pad to a multiple of 4 bytes"""
+    return data + b"\0" * (4 - len(data) % 4)
+
+
+def encode_message(address, args=()):
+    """Encode an OSC message with int, float and string arguments"""
+    tags = ","
+    payload = b""
+    for arg in args:
+        if isinstance(arg, bool) or not isinstance(arg, (int, float, str)):
+            raise ValueError(f"unsupported OSC argument {arg!r}")
+        if isinstance(arg, int):
+            tags += "i"
+            payload += struct.pack(">i", arg)
+        elif isinstance(arg, float):
+            tags += "f"
+            payload += struct.pack(">f", arg)
+        else:
+            tags += "s"
+            payload += _pad(arg.encode())
+    return OscPacket(_pad(address.encode()) + _pad(tags.encode()) + payload)
+
+
+def _read_string(data, offset):
+    end = data.index(b"\0", offset)
+    return data[offset:end].decode(), (end + 4) & ~3
+
+
+def decode_message(data):
+    """Decode one OSC message into (address, [args])
+
+    Unsupported argument types end the argument list.
+    """
+    address, offset = _read_string(data, 0)
+    if offset >= len(data):
+        return address, []
+    tags, offset = _read_string(data, offset)
+    args = []
+    for tag in tags[1:]:
+        if tag == "i":
+            args.append(struct.unpack_from(">i", data, offset)[0])
+            offset += 4
+        elif tag == "f":
+            args.append(struct.unpack_from(">f", data, offset)[0])
+            offset += 4
+        elif tag == "s":
+            value, offset = _read_string(data, offset)
+            args.append(value)
+        elif tag == "T":
+            args.append(True)
+        elif tag == "F":
+            args.append(False)
+        else:
+            break
+    return address, args
+
+
+def decode_packet(data):
+    """Return the (address, args) of every message in a packet or bundle"""
+    if not data.startswith(b"#bundle\0"):
+        return [decode_message(data)]
+    messages = []
+    offset = 16  # "#bundle\0" and the time tag
+    while offset + 4 <= len(data):
+        (size,) = struct.unpack_from(">i", data, offset)
+        offset += 4
+        messages.extend(decode_packet(data[offset : offset + size]))
+        offset += size
+    return messages
+
+
+def osc_value(args):
+    """Return the first argument as a 0-127 value for the pad display"""
+    if not args or isinstance(args[0], (str, bool)):
+        return None
+    value = args[0]
+    if isinstance(value, float) and 0.0 <= value <= 1.0:
+        # Normalized floats, as sent by most OSC control surfaces
+        value = value * 127
+    return max(0, min(127, int(value)))
+
+
+class OscBridge:
+    """UDP listener and sender for OSC
+
+    Incoming messages are passed to `handler(address, args)` on the
+    listener thread.
+    """
+
+    def __init__(
+        self,
+        handler,
+        listen_host="127.0.0.1",
+        listen_port=None,
+        send_host="127.0.0.1",
+        send_port=None,
+    ):
+        self.handler = handler
+        self.listen_address = (listen_host, listen_port)
+        self.send_address = (send_host, send_port)
+        self.listen_socket = None
+        self.send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.thread = None
+        self.running = False
+        self.packets_received = 0
+        self.packets_sent = 0
+
+    def start(self):
+        if self.listen_address[1] is None:
+            return
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Room for bursts, e.g. a fader sweep from a control surface
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.listen_socket.bind(self.listen_address)
+        # Port 0 picks a free port
+        self.listen_address = self.listen_socket.getsockname()
+        self.listen_socket.settimeout(0.2)  # So stop() is noticed
+        self.running = True
+        self.thread = threading.Thread(target=self.listen, name="osc", daemon=True)
+        self.thread.start()
+        print(f"OSC listening on {self.listen_address[0]}:{self.listen_address[1]}")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.listen_socket is not None:
+            self.listen_socket.close()
+            self.listen_socket = None
+        self.send_socket.close()
+
+    def listen(self):
+        while self.running:
+            try:
+                data = self.listen_socket.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.packets_received += 1
+            try:
+                messages = decode_packet(data)
+            except Exception as e:
+                print(f"Ignoring invalid OSC packet: {e}")
+                continue
+            for address, args in messages:
+                try:
+                    self.handler(address, args)
+                except Exception:
+                    # One failing message must not stop the listener
+                    print(f"Error handling OSC message {address}:")
+                    traceback.print_exc()
+
+    def send(self, packet):
+        if self.send_address[1] is None:
+            return
+        try:
+            self.send_socket.sendto(packet, self.send_address)
+            self.packets_sent += 1
+        except OSError as e:
+            print(f"Error sending OSC: {e}")
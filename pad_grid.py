@@ -0,0 +1,382 @@
+"""Custom painted grid of touch pads.
+
+All pads, their press state, value meters and the MIDI learn overlay are
+drawn by a single widget. Pad geometry is computed once per resize, each pad
+face (rounded rectangle and name) is rendered once into a pixmap and every
+state change only repaints the rectangle of the pad it affects. A repaint is
+then a pixmap blit plus a plain rectangle for the meter, which keeps it cheap
+on software rendered displays such as the Raspberry Pi framebuffer.
+
+Mouse clicks press a pad on release, like a push button. Touch screens get
+a faster path: a finger landing on a pad presses it right away, several
+fingers press several pads, and the pad under a point is found with
+arithmetic on the grid geometry rather than testing every rectangle. Since
+a touch on a pad has already played it, touch swipes only start outside
+the pads (the margins and the gaps between them).
+"""
+from PySide6.QtCore import QEvent, QRect, QRectF, Qt, Signal
+from PySide6.QtGui import QColor, QEventPoint, QFont, QPainter, QPixmap
+from PySide6.QtWidgets import QSizePolicy, QWidget
+
+PAD_COLORS = [
+    "#FF5252",
+    "#FF4081",
+    "#7C4DFF",
+    "#448AFF",
+    "#64FFDA",
+    "#69F0AE",
+    "#FFEB3B",
+    "#FF9800",
+]
+
+
+class PadGrid(QWidget):
+    # Emitted when a pad is clicked (pressed and released on the same pad)
+    padClicked = Signal(int)
+    # Emitted when a finger lands on a pad, without waiting for the release
+    padTouched = Signal(int)
+    # Emitted by the OK/Cancel areas of the MIDI learn overlay
+    learnConfirmed = Signal(int)
+    learnCancelled = Signal()
+    # Emitted on a horizontal swipe: 1 for right to left, -1 for left to right
+    swiped = Signal(int)
+
+    def __init__(self, count=8, columns=4, parent=None):
+        super().__init__(parent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        # Every pixel is painted, Qt can skip clearing the background
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setAttribute(Qt.WA_AcceptTouchEvents)
+
+        self.columns = columns
+        self.spacing = 20
+        self.margin = 20
+        self.radius = 15
+
+        self.names = [f"Button {i+1}" for i in range(count)]
+        self.colors = [QColor(PAD_COLORS[i % len(PAD_COLORS)]) for i in range(count)]
+        self.pressed_colors = [color.darker(140) for color in self.colors]
+        self.flash_colors = [color.lighter(150) for color in self.colors]
+        self.pressed = [False] * count
+        self.flashing = [False] * count  # Highlighted on MIDI activity
+        self.values = [None] * count  # 0-127 shows a meter, None hides it
+        self.latched = [False] * count  # Target device holds the pad's output
+
+        self.pressed_pad = None  # Pad under the mouse while it is held down
+        self.press_pos = None  # Where the mouse went down, to detect swipes
+        # Touch point id -> (pad index or None, where the finger landed)
+        self.touches = {}
+
+        # MIDI learn overlay
+        self.learning_pad = None
+        self.learn_text = ""
+        self.learn_rect = QRect()
+        self.ok_rect = QRect()
+        self.cancel_rect = QRect()
+
+        # Painting resources, created once
+        self.background = QColor("#202020")
+        self.text_color = QColor("white")
+        self.meter_color = QColor(255, 255, 255, 160)
+        self.latch_color = QColor("white")
+        self.overlay_color = QColor(0, 0, 0, 204)
+        self.ok_color = QColor("#2196F3")
+        self.cancel_color = QColor("#F44336")
+        self.name_font = QFont()
+        self.name_font.setPixelSize(24)
+        self.name_font.setBold(True)
+        self.learn_font = QFont()
+        self.learn_font.setPixelSize(16)
+
+        self.rects = [QRect() for _ in range(count)]
+        # Grid geometry for hit testing, set by layout_pads
+        self.pad_width = self.pad_height = 0
+        self.step_x = self.step_y = 1
+        # index -> (normal, pressed, flashing) pixmaps of the pad face
+        self.faces = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def set_name(self, index, name):
+        if self.names[index] != name:
+            self.names[index] = name
+            self.faces.pop(index, None)
+            self.update_pad(index)
+
+    def set_pressed(self, index, pressed):
+        if self.pressed[index] != pressed:
+            self.pressed[index] = pressed
+            self.update_pad(index)
+
+    def set_flash(self, index, flashing):
+        if self.flashing[index] != flashing:
+            self.flashing[index] = flashing
+            self.update_pad(index)
+
+    def set_latched(self, index, latched):
+        if self.latched[index] != latched:
+            self.latched[index] = latched
+            self.update_pad(index)
+
+    def set_value(self, index, value):
+        if self.values[index] != value:
+            self.values[index] = value
+            self.update_pad(index)
+
+    def update_pad(self, index):
+        """Schedule a repaint of a single pad"""
+        self.update(self.rects[index])
+
+    def show_learn(self, index, text="Waiting for MIDI message..."):
+        """Show the MIDI learn overlay on a pad"""
+        if self.learning_pad is not None and self.learning_pad != index:
+            self.hide_learn()
+        self.learning_pad = index
+        self.learn_text = text
+        self.layout_learn()
+        self.update_pad(index)
+
+    def set_learn_text(self, text):
+        if self.learning_pad is not None:
+            self.learn_text = text
+            self.update(self.learn_rect)
+
+    def hide_learn(self):
+        if self.learning_pad is not None:
+            index, self.learning_pad = self.learning_pad, None
+            self.update_pad(index)
+
+    def pad_at(self, pos):
+        """Return the index of the pad at a widget position, or None"""
+        return self.pad_at_xy(pos.x(), pos.y())
+
+    def pad_at_xy(self, x, y):
+        """Return the index of the pad at widget coordinates, or None"""
+        column, dx = divmod(x - self.margin, self.step_x)
+        row, dy = divmod(y - self.margin, self.step_y)
+        if (
+            column < 0
+            or row < 0
+            or column >= self.columns
+            or dx >= self.pad_width
+            or dy >= self.pad_height
+        ):
+            return None  # Outside the grid or in the spacing between pads
+        index = row * self.columns + column
+        return index if index < len(self.names) else None
+
+    def resizeEvent(self, event):
+        self.layout_pads()
+        super().resizeEvent(event)
+
+    def layout_pads(self):
+        """Compute the pad rectangles for the current size"""
+        count = len(self.names)
+        rows = max(1, -(-count // self.columns))
+        width = self.width() - 2 * self.margin - (self.columns - 1) * self.spacing
+        height = self.height() - 2 * self.margin - (rows - 1) * self.spacing
+        pad_width = max(1, width // self.columns)
+        pad_height = max(1, height // rows)
+        self.pad_width = pad_width
+        self.pad_height = pad_height
+        self.step_x = pad_width + self.spacing
+        self.step_y = pad_height + self.spacing
+        for i in range(count):
+            row, col = divmod(i, self.columns)
+            self.rects[i] = QRect(
+                self.margin + col * (pad_width + self.spacing),
+                self.margin + row * (pad_height + self.spacing),
+                pad_width,
+                pad_height,
+            )
+        self.faces.clear()
+        if self.learning_pad is not None:
+            self.layout_learn()
+
+    def layout_learn(self):
+        """Place the learn label and OK/Cancel areas inside the learning pad"""
+        rect = self.rects[self.learning_pad].adjusted(10, 10, -10, -10)
+        half = rect.height() // 2
+        self.learn_rect = QRect(rect.left(), rect.top(), rect.width(), half - 5)
+        button_width = (rect.width() - 10) // 2
+        top = rect.top() + half + 5
+        self.ok_rect = QRect(rect.left(), top, button_width, rect.bottom() - top)
+        self.cancel_rect = QRect(
+            rect.left() + button_width + 10, top, button_width, rect.bottom() - top
+        )
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        dirty = event.rect()
+        painter.fillRect(dirty, self.background)
+
+        # Only pads inside the dirty rectangle are drawn
+        for i, rect in enumerate(self.rects):
+            if rect.intersects(dirty):
+                self.paint_pad(painter, i, rect)
+
+        if self.learning_pad is not None and self.rects[
+            self.learning_pad
+        ].intersects(dirty):
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(Qt.NoPen)
+            self.paint_learn(painter)
+        painter.end()
+
+    def paint_pad(self, painter, index, rect):
+        faces = self.faces.get(index)
+        if faces is None:
+            faces = self.faces[index] = (
+                self.render_face(index, self.colors[index]),
+                self.render_face(index, self.pressed_colors[index]),
+                self.render_face(index, self.flash_colors[index]),
+            )
+        if self.pressed[index]:
+            face = faces[1]
+        elif self.flashing[index]:
+            face = faces[2]
+        else:
+            face = faces[0]
+        painter.drawPixmap(rect.topLeft(), face)
+
+        if self.latched[index]:
+            # "LED" bar along the top edge of the pad
+            painter.fillRect(
+                rect.left() + self.radius,
+                rect.top() + 6,
+                rect.width() - 2 * self.radius,
+                6,
+                self.latch_color,
+            )
+
+        value = self.values[index]
+        if value is not None:
+            # Value meter along the bottom edge of the pad
+            painter.fillRect(
+                rect.left() + self.radius,
+                rect.bottom() - 12,
+                (rect.width() - 2 * self.radius) * value // 127,
+                6,
+                self.meter_color,
+            )
+
+    def render_face(self, index, color):
+        """Render the rounded rectangle and name of a pad into a pixmap"""
+        rect = QRect(0, 0, self.rects[index].width(), self.rects[index].height())
+        pixmap = QPixmap(rect.size())
+        pixmap.fill(self.background)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(color)
+        painter.drawRoundedRect(QRectF(rect), self.radius, self.radius)
+        painter.setPen(self.text_color)
+        painter.setFont(self.name_font)
+        painter.drawText(rect, Qt.AlignCenter | Qt.TextWordWrap, self.names[index])
+        painter.end()
+        return pixmap
+
+    def paint_learn(self, painter):
+        painter.setBrush(self.overlay_color)
+        painter.drawRoundedRect(QRectF(self.learn_rect), 5, 5)
+        painter.setBrush(self.ok_color)
+        painter.drawRoundedRect(QRectF(self.ok_rect), 3, 3)
+        painter.setBrush(self.cancel_color)
+        painter.drawRoundedRect(QRectF(self.cancel_rect), 3, 3)
+
+        painter.setPen(self.text_color)
+        painter.setFont(self.learn_font)
+        painter.drawText(self.learn_rect, Qt.AlignCenter | Qt.TextWordWrap, self.learn_text)
+        painter.drawText(self.ok_rect, Qt.AlignCenter, "OK")
+        painter.drawText(self.cancel_rect, Qt.AlignCenter, "Cancel")
+        painter.setPen(Qt.NoPen)
+
+    def swipe_direction(self, dx, dy):
+        """Return 1 for a swipe right to left, -1 for left to right, else 0"""
+        # Mostly horizontal and across a quarter of the grid
+        if abs(dx) > self.width() // 4 and abs(dx) > 2 * abs(dy):
+            return 1 if dx < 0 else -1
+        return 0
+
+    def event(self, event):
+        kind = event.type()
+        if kind in (
+            QEvent.TouchBegin,
+            QEvent.TouchUpdate,
+            QEvent.TouchEnd,
+            QEvent.TouchCancel,
+        ):
+            return self.touch_event(event)
+        return super().event(event)
+
+    def touch_event(self, event):
+        if event.type() == QEvent.TouchBegin and self.learning_pad is not None:
+            # Unhandled touches arrive as mouse events, for the learn overlay
+            event.ignore()
+            return False
+        if event.type() == QEvent.TouchCancel:
+            for index, _ in self.touches.values():
+                if index is not None:
+                    self.set_pressed(index, False)
+            self.touches.clear()
+            return True
+
+        for point in event.points():
+            state = point.state()
+            if state == QEventPoint.Pressed:
+                pos = point.position()
+                index = self.pad_at_xy(int(pos.x()), int(pos.y()))
+                self.touches[point.id()] = (index, pos)
+                if index is not None:
+                    # Send first, the pressed face is only drawn on the next paint
+                    self.padTouched.emit(index)
+                    self.set_pressed(index, True)
+            elif state == QEventPoint.Released:
+                index, start = self.touches.pop(point.id(), (None, None))
+                if index is not None and all(
+                    other != index for other, _ in self.touches.values()
+                ):
+                    self.set_pressed(index, False)
+                # A touch that landed on a pad played it, it isn't a swipe
+                if index is None and start is not None and not self.touches:
+                    delta = point.position() - start
+                    direction = self.swipe_direction(delta.x(), delta.y())
+                    if direction:
+                        self.swiped.emit(direction)
+        event.accept()
+        return True
+
+    def mousePressEvent(self, event):
+        pos = event.position().toPoint()
+        if self.learning_pad is not None:
+            # The learn overlay handles its own clicks on release
+            return
+        self.press_pos = pos
+        self.pressed_pad = self.pad_at(pos)
+        if self.pressed_pad is not None:
+            self.set_pressed(self.pressed_pad, True)
+
+    def mouseReleaseEvent(self, event):
+        pos = event.position().toPoint()
+        if self.learning_pad is not None:
+            if self.ok_rect.contains(pos):
+                self.learnConfirmed.emit(self.learning_pad)
+            elif self.cancel_rect.contains(pos):
+                self.learnCancelled.emit()
+            return
+        index, self.pressed_pad = self.pressed_pad, None
+        if index is not None:
+            self.set_pressed(index, False)
+        if self.press_pos is not None:
+            delta = pos - self.press_pos
+            self.press_pos = None
+            direction = self.swipe_direction(delta.x(), delta.y())
+            if direction:
+                self.swiped.emit(direction)
+                return
+        if index is None:
+            return
+        # Like a push button, a press only counts if released on the same pad
+        if self.rects[index].contains(pos):
+            self.padClicked.emit(index)
@@ -0,0 +1,85 @@
+"""Per-pad activity shared between the MIDI side and the UI.
+
+The router writes into flat buffers (a trigger counter, a last value and a
+latched flag per pad) and the UI samples them on a fixed-rate timer, so the cost of updating
+the display does not depend on how many MIDI messages arrive. Single element
+reads and writes don't need a lock, a sample is at worst one message behind.
+"""
+
+NO_VALUE = 255  # Stored in `values` for pads that have not received a value
+
+
+class PadState:
+    """Trigger counters and last values of every pad in one buffer"""
+
+    def __init__(self, size, buffer=None):
+        """Create the buffers, or attach to an existing (e.g. shared) buffer"""
+        created = buffer is None
+        if created:
+            buffer = bytearray(self.buffer_size(size))
+        self.size = size
+        self.buffer = buffer
+        view = memoryview(buffer)
+        # uint32 per pad, incremented (and wrapped) on every trigger
+        self.triggers = view[: 4 * size].cast("I")
+        # uint8 per pad, 0-127 or NO_VALUE
+        self.values = view[4 * size : 5 * size]
+        # uint8 per pad, 1 while the target device holds the pad's output
+        self.latched = view[5 * size : 6 * size]
+        if created:
+            self.values[:] = bytes([NO_VALUE]) * size
+
+    @staticmethod
+    def buffer_size(size):
+        return 6 * size
+
+    def trigger(self, index):
+        self.triggers[index] = (self.triggers[index] + 1) & 0xFFFFFFFF
+
+    def set_value(self, index, value):
+        self.values[index] = value
+
+    def set_latched(self, index, latched):
+        self.latched[index] = latched
+
+
+class PadStateSampler:
+    """Reads a PadState at a fixed rate and reports only what changed"""
+
+    def __init__(self, state):
+        self.state = state
+        self.triggers = state.triggers.tolist()
+        self.values = bytes(state.values)
+        self.latched = bytes(state.latched)
+
+    def sample(self):
+        """Return (triggered pads, {pad: value}, {pad: latched}) since the
+        previous sample"""
+        triggers = self.state.triggers.tolist()
+        triggered = []
+        if triggers != self.triggers:
+            triggered = [
+                i for i, (new, old) in enumerate(zip(triggers, self.triggers)) if new != old
+            ]
+            self.triggers = triggers
+
+        values = bytes(self.state.values)
+        changed = {}
+        if values != self.values:
+            changed = {
+                i: (None if new == NO_VALUE else new)
+                for i, (new, old) in enumerate(zip(values, self.values))
+                if new != old
+            }
+            self.values = values
+
+        latched = bytes(self.state.latched)
+        changed_latched = {}
+        if latched != self.latched:
+            changed_latched = {
+                i: bool(new)
+                for i, (new, old) in enumerate(zip(latched, self.latched))
+                if new != old
+            }
+            self.latched = latched
+        return triggered, changed, changed_latched
@@ -0,0 +1,84 @@
+"""Resource monitor for long running sessions.
+
+Samples a set of probes (RSS, Qt object counts, open MIDI clients, ...) at
+an interval and warns when one of them keeps growing. With tracemalloc
+enabled, the allocations that grew since the previous sample are listed
+too, to point at the leak.
+"""
+import os
+import sys
+import tracemalloc
+from collections import deque
+
+
+def rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Not Linux, fall back to the peak RSS
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def growth(values):
+    """Relative growth of the least squares line through the values"""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / sum(
+        (x - mean_x) ** 2 for x in range(n)
+    )
+    return slope * (n - 1) / max(abs(values[0]), 1)
+
+
+class ResourceMonitor:
+    """Flags probes that grew by more than `threshold` over `window` samples
+
+    `probes` maps a name to a function returning a number.
+    """
+
+    def __init__(self, probes, window=10, threshold=0.05, trace=False):
+        self.probes = probes
+        self.threshold = threshold
+        self.history = {name: deque(maxlen=window) for name in probes}
+        self.growing = set()
+        self.snapshot = None
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def sample(self):
+        """Sample every probe, returning warnings for newly growing ones"""
+        warnings = []
+        for name, probe in self.probes.items():
+            values = self.history[name]
+            values.append(probe())
+            if len(values) < values.maxlen:
+                continue
+            rate = growth(values)
+            if rate > self.threshold:
+                if name not in self.growing:
+                    self.growing.add(name)
+                    warnings.append(
+                        f"{name} keeps growing: {values[0]:g} -> {values[-1]:g} "
+                        f"over the last {len(values)} samples"
+                    )
+            else:
+                self.growing.discard(name)
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            if warnings and self.snapshot is not None:
+                stats = snapshot.compare_to(self.snapshot, "lineno")[:5]
+                warnings.extend(f"  {stat}" for stat in stats if stat.size_diff > 0)
+            self.snapshot = snapshot
+        return warnings
+
+    def latest(self):
+        """Return the last sampled value of every probe"""
+        return {name: values[-1] for name, values in self.history.items() if values}
@@ -0,0 +1,159 @@
+"""SysEx outputs.
+
+A pad's SysEx output is a template of hex bytes, e.g.
+"F0 43 10 4C 08 00 0B vv F7", where "vv" is replaced by the pad's output
+value. A template can hold several complete messages (a dump).
+
+Templates are compiled into messages when the config is loaded. Short ones
+are sent like any other output, larger dumps are handed to a SysexSender,
+which sends them a chunk of messages at a time, paced to what the device
+can take, so a dump never holds up notes, CCs or touch handling.
+"""
+import threading
+import time
+from collections import deque
+
+# Dumps larger than this are sent in paced chunks of about this size
+CHUNK_BYTES = 256
+# 5-pin DIN MIDI: 31250 baud, 10 bits per byte
+DIN_BYTES_PER_SECOND = 3125
+
+
+class SysexDump(tuple):
+    """Messages of a large dump, sent in chunks by a SysexSender"""
+
+    def __new__(cls, messages):
+        dump = super().__new__(cls, messages)
+        dump.size = sum(len(message) for message in messages)
+        return dump
+
+
+def parse_sysex(template, value=0):
+    """Compile a template into a list of messages (lists of bytes)
+
+    Raises ValueError if the template is not a sequence of complete SysEx
+    messages.
+    """
+    data = []
+    for token in template.split():
+        if token.lower() == "vv":
+            data.append(value)
+            continue
+        try:
+            byte = int(token, 16)
+        except ValueError:
+            raise ValueError(f"{token!r} is not a hex byte")
+        if not 0 <= byte <= 0xFF:
+            raise ValueError(f"{token!r} is not a hex byte")
+        data.append(byte)
+
+    messages = []
+    message = None
+    for byte in data:
+        if byte == 0xF0:
+            if message is not None:
+                raise ValueError("F0 before the previous message ended with F7")
+            message = [byte]
+        elif message is None:
+            raise ValueError(f"{byte:02X} outside of F0 ... F7")
+        elif byte == 0xF7:
+            message.append(byte)
+            messages.append(message)
+            message = None
+        elif byte >= 0x80:
+            raise ValueError(f"{byte:02X} is not a data byte")
+        else:
+            message.append(byte)
+    if message is not None:
+        raise ValueError("missing F7 at the end")
+    if not messages:
+        raise ValueError("no SysEx message")
+    return messages
+
+
+def sysex_messages(template, value):
+    """Precompute the output messages of a SysEx template"""
+    messages = parse_sysex(template, value)
+    if sum(len(message) for message in messages) > CHUNK_BYTES:
+        return (SysexDump(messages),)
+    return tuple(messages)
+
+
+def chunks(dump, chunk_bytes=CHUNK_BYTES):
+    """Group the messages of a dump into chunks of about chunk_bytes"""
+    chunk = []
+    size = 0
+    for message in dump:
+        if chunk and size + len(message) > chunk_bytes:
+            yield chunk, size
+            chunk = []
+            size = 0
+        chunk.append(message)
+        size += len(message)
+    if chunk:
+        yield chunk, size
+
+
+class SysexSender:
+    """Sends dumps in paced chunks on a background thread
+
+    `send(message)` sends one message. Messages are never split, so other
+    outputs can go out between two messages of a dump. `bytes_per_second`
+    0 sends as fast as the port takes them.
+    """
+
+    def __init__(self, send, bytes_per_second=DIN_BYTES_PER_SECOND):
+        self.send = send
+        self.bytes_per_second = bytes_per_second
+        self.pending = deque()
+        self.wakeup = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.bytes_sent = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="sysex", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            with self.wakeup:
+                self.running = False
+                self.wakeup.notify()
+            self.thread.join()
+            self.thread = None
+
+    def queue(self, dump):
+        if self.thread is None:
+            self.start()
+        with self.wakeup:
+            self.pending.append(dump)
+            self.wakeup.notify()
+
+    def idle(self):
+        return not self.pending
+
+    def run(self):
+        while True:
+            with self.wakeup:
+                while self.running and not self.pending:
+                    self.wakeup.wait()
+                if not self.running:
+                    return
+                dump = self.pending[0]
+            # Each chunk has a deadline, so time spent sending is not added
+            deadline = time.perf_counter()
+            for chunk, size in chunks(dump):
+                for message in chunk:
+                    self.send(message)
+                self.bytes_sent += size
+                if self.bytes_per_second:
+                    deadline += size / self.bytes_per_second
+                    delay = deadline - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                if not self.running:
+                    return
+            with self.wakeup:
+                self.pending.popleft()
@@ -1,11 +1,9 @@
-from PySide6.QtCore import Qt, QEvent, QRect, QPoint
+from PySide6.QtCore import Qt, QFileSystemWatcher, QObject, QTimer, Signal
 from PySide6.QtWidgets import (
     QApplication,
     QMainWindow,
     QPushButton,
     QWidget,
-    QGridLayout,
-    QSizePolicy,
     QMenuBar,
     QMenu,
     QDialog,
@@ -20,16 +18,55 @@ from PySide6.QtWidgets import (
     QFileDialog,
     QMessageBox,
 )
-from PySide6.QtGui import QMouseEvent
+from PySide6.QtGui import QKeySequence
+import argparse
+import gc
 import sys
-import rtmidi
+import time
 import json
 from pathlib import Path
 
+from config_schema import (
+    GESTURES,
+    MESSAGE_TYPES,
+    OUTPUT_TYPES,
+    ConfigError,
+    check_midi_message,
+    load_config_file,
+)
+from mapping_store import MappingJournal, MappingStore
+from midi_router import MidiRouter
+from pad_grid import PadGrid
+from pad_state import PadState, PadStateSampler
+from control_server import DEFAULT_PORT, DEFAULT_SOCKET, ControlServer
+from midi_recorder import MidiRecorder
+from osc import OscBridge
+from resource_monitor import ResourceMonitor, rss_mb
+from midi_backend import (
+    accept_system_messages,
+    create_midi_in,
+    create_midi_out,
+    open_clients,
+    open_port,
+)
+from midi_engine import MidiEngine
+from engine_process import EngineProcess
+from midi_worker import MidiWorker, available_cores, pin_thread, tune_interpreter
+from sysex import DIN_BYTES_PER_SECOND
+
+FEEDBACK_RATE = 60  # Pad activity display updates per second
+FLASH_DURATION = 0.1  # Seconds a pad stays highlighted after a trigger
+RELOAD_DELAY_MS = 50  # Editors write a file in several steps
+
 
 class MIDIDeviceDialog(QDialog):
-    def __init__(self, parent=None, current_input=None, current_output=None):
+    def __init__(
+        self, midi_in, midi_out, parent=None, current_input=None, current_output=None
+    ):
         super().__init__(parent)
+        # The app's own clients list the ports, no new clients per refresh
+        self.midi_in = midi_in
+        self.midi_out = midi_out
         self.setWindowTitle("MIDI Device Selection")
         layout = QVBoxLayout(self)
 
@@ -76,9 +113,8 @@ class MIDIDeviceDialog(QDialog):
         self.refresh_output_devices()
 
     def refresh_input_devices(self):
-        midi_in = rtmidi.RtMidiIn()
         self.input_combo.clear()
-        ports = midi_in.get_ports()
+        ports = self.midi_in.get_ports()
         self.input_combo.addItems(ports)
 
         # Restore previous selection if it exists
@@ -86,9 +122,8 @@ class MIDIDeviceDialog(QDialog):
             self.input_combo.setCurrentText(self.current_input)
 
     def refresh_output_devices(self):
-        midi_out = rtmidi.RtMidiOut()
         self.output_combo.clear()
-        ports = midi_out.get_ports()
+        ports = self.midi_out.get_ports()
         self.output_combo.addItems(ports)
 
         # Restore previous selection if it exists
@@ -108,7 +143,29 @@ class MIDILearnDialog(QDialog):
 
 
 class NoteMappingDialog(QDialog):
-    def __init__(self, button_mappings, parent=None):
+    # Table column -> mapping field
+    COLUMNS = [
+        "name",
+        "input_type",
+        "input_number",
+        "output_type",
+        "output_number",
+        "output_value",
+        "gesture",
+        "debounce_ms",
+    ]
+    # Number columns edit another field for some types:
+    # column field -> (type field, {type: field})
+    TYPE_FIELDS = {
+        "input_number": ("input_type", {"osc": "input_address"}),
+        "output_number": (
+            "output_type",
+            {"osc": "output_address", "sysex": "output_sysex"},
+        ),
+    }
+    TEXT_FIELDS = ("input_address", "output_address", "output_sysex")
+
+    def __init__(self, store, parent=None):
         super().__init__(parent)
         self.setWindowTitle("MIDI Mappings")
         self.setModal(False)
@@ -116,14 +173,25 @@ class NoteMappingDialog(QDialog):
         layout = QVBoxLayout(self)
         layout.setContentsMargins(10, 10, 10, 10)
 
-        # Store button mappings and parent
-        self.button_mappings = button_mappings
+        # Store the mapping store and parent
+        self.store = store
         self.main_window = parent
+        # Rows show the pads of this bank
+        self.offset = 0
 
         # Create table with columns for all MIDI parameters
-        self.table = QTableWidget(8, 6)  # Always 8 rows
+        self.table = QTableWidget(store.pads, len(self.COLUMNS))
         self.table.setHorizontalHeaderLabels(
-            ["Button", "Input Type", "Input #", "Output Type", "Output #", "Value"]
+            [
+                "Button",
+                "Input Type",
+                "Input #",
+                "Output Type",
+                "Output #",
+                "Value",
+                "Gesture",
+                "Debounce (ms)",
+            ]
         )
 
         # Set font size for header and cells
@@ -140,256 +208,167 @@ class NoteMappingDialog(QDialog):
         for i in range(self.table.columnCount()):
             self.table.horizontalHeader().setSectionResizeMode(i, QHeaderView.Stretch)
 
-        # MIDI type options
-        self.midi_types = ["note", "cc", "pc"]
+        # Options of the combo box columns
+        self.midi_types = {
+            "input_type": MESSAGE_TYPES,
+            "output_type": OUTPUT_TYPES,
+            "gesture": GESTURES,
+        }
 
         # Fill table with current mappings
-        self.row_to_button = {}  # Map table rows to button objects
-        buttons = list(button_mappings.values())
-        for i in range(8):  # Always process 8 rows
-            button = buttons[i]
-
-            # Editable button name
-            button_name_item = QTableWidgetItem(button.text())
-            button_name_item.setFlags(button_name_item.flags() | Qt.ItemIsEditable)
-            self.table.setItem(i, 0, button_name_item)
-
-            # Input type combo
-            input_type_combo = QComboBox()
-            input_type_combo.setFont(font)
-            input_type_combo.addItems(self.midi_types)
-            input_type_combo.setCurrentText(button.input_type)
-            self.table.setCellWidget(i, 1, input_type_combo)
-
-            # Input number
-            input_number_item = QTableWidgetItem(str(button.input_number or ""))
-            self.table.setItem(i, 2, input_number_item)
-
-            # Output type combo
-            output_type_combo = QComboBox()
-            output_type_combo.setFont(font)
-            output_type_combo.addItems(self.midi_types)
-            output_type_combo.setCurrentText(button.output_type)
-            self.table.setCellWidget(i, 3, output_type_combo)
-
-            # Output number
-            output_number_item = QTableWidgetItem(str(button.output_number or ""))
-            self.table.setItem(i, 4, output_number_item)
-
-            # Value (for CC)
-            value_item = QTableWidgetItem(str(button.output_value))
-            self.table.setItem(i, 5, value_item)
-
-            # Map row to button
-            self.row_to_button[i] = button
-
-            # Connect change handlers
-            def make_handler(btn):
-                def handler():
-                    self.update_button_config(btn)
-
-                return handler
-
-            input_type_combo.currentTextChanged.connect(make_handler(button))
-            output_type_combo.currentTextChanged.connect(make_handler(button))
+        for row in range(store.pads):
+            for col, field in enumerate(self.COLUMNS):
+                if field in self.midi_types:
+                    combo = QComboBox()
+                    combo.setFont(font)
+                    combo.addItems(self.midi_types[field])
+                    self.table.setCellWidget(row, col, combo)
+                    # The row and field are bound here, no lookup on change
+                    combo.currentTextChanged.connect(
+                        lambda text, row=row, field=field: self.set_field(
+                            row, field, text
+                        )
+                    )
+                else:
+                    self.table.setItem(row, col, QTableWidgetItem())
+            self.refresh_row(row)
 
         # Connect itemChanged signal for direct cell edits
         self.table.itemChanged.connect(self.on_cell_changed)
 
+        # Refresh single rows when mappings change elsewhere (e.g. MIDI learn)
+        self.store.listeners.append(self.on_mapping_changed)
+        self.finished.connect(
+            lambda: self.store.listeners.remove(self.on_mapping_changed)
+        )
+
         layout.addWidget(self.table)
 
-    def on_cell_changed(self, item):
-        row = item.row()
-        col = item.column()
-        button = self.row_to_button[row]
+    def set_bank(self, bank):
+        """Show the mappings of another bank"""
+        self.offset = bank * self.store.pads
+        for row in range(self.store.pads):
+            self.refresh_row(row)
+
+    def refresh_row(self, row):
+        """Show the stored mapping of one button"""
+        self.table.blockSignals(True)
+        for col in range(len(self.COLUMNS)):
+            field = self.field_at(row, col)
+            value = self.store.get(self.offset + row, field)
+            if field in self.midi_types:
+                combo = self.table.cellWidget(row, col)
+                combo.blockSignals(True)
+                combo.setCurrentText(value)
+                combo.blockSignals(False)
+            else:
+                self.table.item(row, col).setText("" if value is None else str(value))
+        self.table.blockSignals(False)
+
+    def field_at(self, row, col):
+        """Return the mapping field shown in a cell"""
+        field = self.COLUMNS[col]
+        if field in self.TYPE_FIELDS:
+            type_field, fields = self.TYPE_FIELDS[field]
+            return fields.get(self.store.get(self.offset + row, type_field), field)
+        return field
+
+    def on_mapping_changed(self, delta):
+        row = delta[0] - self.offset
+        if 0 <= row < self.store.pads:
+            self.refresh_row(row)
 
+    def on_cell_changed(self, item):
+        field = self.field_at(item.row(), item.column())
+        value = item.text().strip()
         try:
-            value = item.text()
-            if col == 0:  # Button name
-                old_name = button.text()
-                new_name = value.strip()
-                if new_name and new_name != old_name:
-                    # Update button text
-                    button.setText(new_name)
-                    
-                    # Update mappings in main window
-                    if self.main_window:
-                        if old_name in self.main_window.buttons:
-                            self.main_window.buttons[new_name] = self.main_window.buttons.pop(old_name)
-                            # Update button_order
-                            if old_name in self.main_window.button_order:
-                                index = self.main_window.button_order.index(old_name)
-                                self.main_window.button_order[index] = new_name
-                
-            elif col == 2:  # Input number
-                button.input_number = int(value) if value else None
-            elif col == 4:  # Output number
-                button.output_number = int(value) if value else None
-            elif col == 5:  # Value
-                button.output_value = int(value) if value else 127
-
-            # Save after each change
-            if self.main_window:
-                self.main_window.save_config()
-            
+            if field == "output_value":
+                value = int(value) if value else 127
+            elif field == "debounce_ms":
+                value = int(value) if value else 0
+            elif field in self.TEXT_FIELDS:
+                value = value or None
+            elif field != "name":
+                value = int(value) if value else None
         except ValueError:
             # Restore previous value if invalid input
-            if col == 2:
-                item.setText(str(button.input_number or ""))
-            elif col == 4:
-                item.setText(str(button.output_number or ""))
-            elif col == 5:
-                item.setText(str(button.output_value))
-
-    def update_button_config(self, button):
-        try:
-            # Find the row for this button
-            row = None
-            for i, btn in enumerate(self.button_mappings.values()):
-                if btn == button:
-                    row = i
-                    break
-
-            if row is not None:
-                # Update input configuration
-                button.input_type = self.table.cellWidget(row, 1).currentText()
-                input_number = self.table.item(row, 2).text()
-                button.input_number = int(input_number) if input_number else None
-
-                # Update output configuration
-                button.output_type = self.table.cellWidget(row, 3).currentText()
-                output_number = self.table.item(row, 4).text()
-                button.output_number = int(output_number) if output_number else None
-
-                value = self.table.item(row, 5).text()
-                button.output_value = int(value) if value else 127
-
-                # Save configuration after each change
-                if self.main_window:
-                    self.main_window.save_config()
-        except ValueError:
-            pass  # Handle invalid number inputs
-
-
-class CustomButton(QPushButton):
-    def __init__(self, name):
-        super().__init__(name)
-        self.input_type = "note"
-        self.input_number = None
-        self.output_type = "note"
-        self.output_number = None
-        self.output_value = 127
-        self.midi_message = None
-
-        # Learn mode UI elements
-        self.learn_label = None
-        self.button_container = None
-        self.ok_button = None
-        self.cancel_button = None
-
-    def hideLearnMode(self):
-        """Hide MIDI learn UI elements"""
-        if self.learn_label:
-            self.learn_label.hide()
-        if self.button_container:
-            self.button_container.hide()
-
-    def showLearnMode(self, pos=None):  # Add pos parameter with default None
-        """Show MIDI learn UI elements"""
-        if self.learn_label is None:
-            # Create label if it doesn't exist
-            self.learn_label = QLabel("Waiting for MIDI message...", self)
-            self.learn_label.setStyleSheet(
-                """
-                QLabel {
-                    background-color: rgba(0, 0, 0, 0.8);
-                    color: white;
-                    padding: 10px;
-                    border-radius: 5px;
-                    font-size: 16px;
-                }
-            """
-            )
-            self.learn_label.setAlignment(Qt.AlignCenter)
-
-            # Create buttons container
-            self.button_container = QWidget(self)
-            button_layout = QHBoxLayout(self.button_container)
-
-            # Create OK and Cancel buttons
-            self.ok_button = QPushButton("OK", self.button_container)
-            self.cancel_button = QPushButton("Cancel", self.button_container)
-
-            # Style buttons
-            button_style = """
-                QPushButton {
-                    background-color: #2196F3;
-                    color: white;
-                    border: none;
-                    padding: 5px 15px;
-                    border-radius: 3px;
-                    font-size: 14px;
-                }
-                QPushButton:hover {
-                    background-color: #1976D2;
-                }
-            """
-            self.ok_button.setStyleSheet(button_style)
-            self.cancel_button.setStyleSheet(
-                button_style.replace("#2196F3", "#F44336").replace("#1976D2", "#D32F2F")
-            )
-
-            # Add buttons to layout
-            button_layout.addWidget(self.ok_button)
-            button_layout.addWidget(self.cancel_button)
-
-            # Connect button signals
-            self.ok_button.clicked.connect(
-                lambda: self.window().finish_midi_learn(self)
-            )
-            self.cancel_button.clicked.connect(
-                lambda: self.window().cancel_midi_learn()
-            )
-
-        # Position the learn UI elements
-        if pos:
-            # Position relative to the clicked position
-            self.learn_label.move(pos.x(), pos.y() - self.learn_label.height())
-            self.button_container.move(pos.x(), pos.y())
-        else:
-            # Center in the button
-            self.learn_label.move(
-                (self.width() - self.learn_label.width()) // 2,
-                (self.height() - self.learn_label.height()) // 2 - 20,
-            )
-            self.button_container.move(
-                (self.width() - self.button_container.width()) // 2,
-                (self.height() - self.button_container.height()) // 2 + 20,
-            )
+            self.refresh_row(item.row())
+            return
+        self.set_field(item.row(), field, value)
 
-        # Show the UI elements
-        self.learn_label.show()
-        self.button_container.show()
+    def set_field(self, row, field, value):
+        try:
+            self.store.set_field(self.offset + row, field, value)
+        except ValueError as e:
+            print(f"Invalid mapping: {e}")
+            # Restore previous value if invalid input
+            self.refresh_row(row)
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # Emitted from the MIDI input thread, delivered on the GUI thread
+    midiLearned = Signal(str)
+    # Scene change requested from the control server thread
+    sceneRequested = Signal(str)
+    # Bank switched by a pad, MIDI or a swipe, on any thread
+    bankChanged = Signal(int)
+
+    def __init__(self, options=None):
         super().__init__()
+        self.options = options or parse_args([])[0]
         self.setWindowTitle("Touch-Friendly MIDI Controller")
         self.showFullScreen()
 
         # Initialize state variables
-        self.buttons = {}
-        self.button_order = []
-        self.current_learning_button = None
+        self.current_learning_pad = None  # Index of the pad in MIDI learn
+        self.learned_message = None  # Message captured in MIDI learn mode
         self.is_learn_mode = False
         self.changes_made = False  # Track changes
 
-        # Initialize MIDI devices
-        self.midi_in = rtmidi.RtMidiIn()
-        self.midi_out = rtmidi.RtMidiOut()
+        # Button mappings and the routing tables compiled from them
+        self.store = MappingStore(8)
+        self.store.listeners.append(self.on_mapping_changed)
+        self.store.history_listeners.append(self.on_history_changed)
+        self.mappings_dialog = None
+        # OSC bridge, (re)started when a config with OSC settings is loaded
+        self.osc_bridge = None
+        self.osc_settings = None
+        # Incoming CC/PC that selects a bank, as in the config
+        self.bank_select = {"input_type": None, "input_number": None}
+        # Double tap and long press times, as in the config
+        self.gesture_timing = None
+        # MIDI thru settings, as in the config
+        self.thru_settings = None
+
+        # Optional log of MIDI input and pad presses, for replaying soak tests
+        self.recorder = None
+        if self.options.record:
+            self.recorder = MidiRecorder(self.options.record)
+            self.recorder.start()
+
+        # Initialize MIDI devices (only used to list ports when the engine
+        # runs in its own process)
+        self.midi_in = create_midi_in(self.options.fake_midi)
+        self.midi_out = create_midi_out(self.options.fake_midi)
         self.current_input_port = None
         self.current_output_port = None
+        # Ports actually opened, kept open when a reloaded config names them
+        self.connected_ports = (None, None)
+        self.sysex_rate = DIN_BYTES_PER_SECOND
+
+        # Routing engine shared by touch, MIDI input and the control server
+        self.midi_worker = None
+        if self.options.engine_process:
+            self.start_engine_process()
+        else:
+            # Pad activity written by the router, sampled by the UI at 60 Hz
+            self.pad_state = PadState(self.store.pads)
+            self.engine = MidiEngine(self.midi_out, MidiRouter(self.pad_state))
+            # In real-time mode MIDI is dispatched on a dedicated worker thread
+            if self.options.realtime:
+                self.start_midi_worker()
+        self.engine.bank_listeners.append(self.bankChanged.emit)
+        self.bankChanged.connect(self.show_bank)
 
         # Set config file paths
         self.config_dir = Path.cwd() / "configs"
@@ -398,12 +377,26 @@ class MainWindow(QMainWindow):
         self.temp_config = self.config_dir / "temp_config.json"
         self.current_config = None
 
+        # The loaded config file is reloaded when it is edited externally
+        self.config_watcher = QFileSystemWatcher(self)
+        self.config_watcher.fileChanged.connect(self.on_config_file_changed)
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(RELOAD_DELAY_MS)
+        self.reload_timer.timeout.connect(self.reload_config)
+        # Compiled banks by path, unchanged banks are not compiled again
+        self.config_cache = {}
+
+        # Edits are journaled on top of the temp config snapshot
+        self.journal = MappingJournal(self.config_dir / "temp_config.journal")
+
         # Setup UI first (this will create default buttons)
         self.setup_ui()
 
         # Load configuration
         if self.temp_config.exists():
             self.load_config(self.temp_config)
+            self.replay_journal()
         elif self.default_config.exists():
             self.load_config(self.default_config)
         else:
@@ -412,6 +405,37 @@ class MainWindow(QMainWindow):
         # Setup menu
         self.setup_menu()
 
+        # Show MIDI activity on the pads at a fixed rate, however busy MIDI is
+        self.pad_sampler = PadStateSampler(self.pad_state)
+        self.flash_deadlines = {}  # pad index -> time its flash ends
+        self.feedback_timer = QTimer(self)
+        self.feedback_timer.timeout.connect(self.update_pad_feedback)
+        self.feedback_timer.start(1000 // FEEDBACK_RATE)
+
+        # Local control server for stage automation
+        self.control_server = None
+        if self.options.control:
+            self.start_control_server()
+
+        # Warn about leaks long before a 10 hour session runs out of memory
+        if self.options.monitor_interval > 0:
+            self.resource_monitor = ResourceMonitor(
+                {
+                    "RSS (MB)": rss_mb,
+                    "Python objects": lambda: len(gc.get_objects()),
+                    "Qt widgets": lambda: len(QApplication.allWidgets()),
+                    "Qt objects": lambda: len(self.findChildren(QObject)),
+                    "MIDI clients": open_clients,
+                },
+                trace=self.options.tracemalloc,
+            )
+            self.monitor_timer = QTimer(self)
+            self.monitor_timer.timeout.connect(self.check_resources)
+            self.monitor_timer.start(int(self.options.monitor_interval * 1000))
+
+        if self.options.realtime:
+            tune_interpreter()
+
     def create_default_config(self):
         """Create a default configuration"""
         default_config = {
@@ -436,29 +460,102 @@ class MainWindow(QMainWindow):
         # Load the default config
         self.load_config(self.default_config)
 
-    def save_config(self, config_file=None):
-        """Save configuration to file"""
-        if config_file is None:
-            config_file = self.temp_config
-
-        config = {
-            "buttons": {
-                btn.text(): {
-                    "input_type": btn.input_type,
-                    "input_number": btn.input_number,
-                    "output_type": btn.output_type,
-                    "output_number": btn.output_number,
-                    "output_value": btn.output_value,
-                    "midi_message": getattr(btn, "midi_message", None),
-                }
-                for btn in self.buttons.values()
-            },
+    def config_dict(self):
+        """Build a config dict from the current mappings"""
+        banks = []
+        for number, bank_name in enumerate(self.store.bank_names):
+            names, mappings = self.store.bank(number)
+            buttons = {
+                name: dict(mapping) for name, mapping in zip(names, mappings)
+            }
+            banks.append({"name": bank_name, "buttons": buttons})
+        # A single bank is saved in the original format
+        if len(banks) == 1:
+            config = {"buttons": banks[0]["buttons"]}
+        else:
+            config = {"banks": banks}
+        return {
+            **config,
+            "bank_select": self.bank_select,
             "midi_ports": {
                 "input": self.current_input_port,
                 "output": self.current_output_port,
+                "sysex_rate": self.sysex_rate,
             },
+            "osc": self.osc_settings or {},
+            "gesture_timing": self.gesture_timing or {},
+            "thru": self.thru_settings or {},
         }
 
+    def on_mapping_changed(self, delta):
+        """Apply a single mapping edit incrementally"""
+        index, field, _, new = delta
+        if field == "name":
+            bank, pad = divmod(index, self.store.pads)
+            if bank == self.engine.bank:
+                self.pad_grid.set_name(pad, new)
+        else:
+            self.engine.update(
+                index,
+                self.store.inputs[index],
+                self.store.outputs[index],
+                self.store.gestures[index],
+            )
+        self.changes_made = True
+
+    def on_history_changed(self, op, group):
+        """Persist an edit, undo or redo, compacting now and then"""
+        if self.temp_config.exists() and not self.journal.needs_compaction:
+            self.journal.append(op, group)
+        else:
+            self.compact_journal()
+        self.update_undo_state()
+
+    def compact_journal(self):
+        """Write the temp config snapshot and keep only the undo history"""
+        self.save_config(self.temp_config)
+        self.journal.rewrite(self.store.history, self.store.redo_stack)
+
+    def replay_journal(self):
+        """Reapply edits journaled after the temp config snapshot"""
+        entries = self.journal.read()
+        # Replayed entries are already in the journal
+        self.store.history_listeners.remove(self.on_history_changed)
+        try:
+            for entry in entries:
+                try:
+                    self.store.replay(entry)
+                except (ValueError, IndexError, TypeError) as e:
+                    print(f"Skipping invalid journal entry {entry!r}: {e}")
+        finally:
+            self.store.history_listeners.append(self.on_history_changed)
+        if entries:
+            print(f"Replayed {len(entries)} journaled change(s)")
+            self.compact_journal()
+        self.update_undo_state()
+
+    def undo(self):
+        """Revert the last mapping change"""
+        group = self.store.undo()
+        if group:
+            print(f"Undid change: {group}")
+
+    def redo(self):
+        """Reapply the last reverted mapping change"""
+        group = self.store.redo()
+        if group:
+            print(f"Redid change: {group}")
+
+    def update_undo_state(self):
+        self.undo_button.setEnabled(bool(self.store.history))
+
+    def save_config(self, config_file=None):
+        """Save configuration to file"""
+        if config_file is None:
+            config_file = self.temp_config
+
+        config = self.config_dict()
+
         try:
             with open(config_file, "w") as f:
                 json.dump(config, f, indent=4)
@@ -477,6 +574,7 @@ class MainWindow(QMainWindow):
         if file_name:
             self.save_config(Path(file_name))
             self.current_config = Path(file_name)
+            self.watch_config()
 
     def closeEvent(self, event):
         """Handle application closing"""
@@ -496,94 +594,39 @@ class MainWindow(QMainWindow):
                     self.save_config_as()
                 if self.temp_config.exists():
                     self.temp_config.unlink()
+                self.journal.truncate()
+                self.shutdown()
                 event.accept()
             elif reply == QMessageBox.Discard:
                 if self.temp_config.exists():
                     self.temp_config.unlink()
+                self.journal.truncate()
+                self.shutdown()
                 event.accept()
             else:
+                # Still running, MIDI and the servers must keep working
                 event.ignore()
         else:
             # If no changes or using default config, just exit
             if self.temp_config.exists():
                 self.temp_config.unlink()
+            self.journal.truncate()
+            self.shutdown()
             event.accept()
 
-    def on_cell_changed(self, item):
-        row = item.row()
-        col = item.column()
-        button = self.row_to_button[row]
-
-        try:
-            value = item.text()
-            if col == 0:  # Button name
-                old_name = button.text()
-                new_name = value.strip()
-                if new_name and new_name != old_name:
-                    # Update button text
-                    button.setText(new_name)
-                    
-                    # Update mappings in main window
-                    if self.main_window:
-                        if old_name in self.main_window.buttons:
-                            self.main_window.buttons[new_name] = self.main_window.buttons.pop(old_name)
-                            # Update button_order
-                            if old_name in self.main_window.button_order:
-                                index = self.main_window.button_order.index(old_name)
-                                self.main_window.button_order[index] = new_name
-                
-            elif col == 2:  # Input number
-                button.input_number = int(value) if value else None
-            elif col == 4:  # Output number
-                button.output_number = int(value) if value else None
-            elif col == 5:  # Value
-                button.output_value = int(value) if value else 127
-
-            # Save after each change
-            if self.main_window:
-                self.main_window.save_config()
-            
-        except ValueError:
-            # Restore previous value if invalid input
-            if col == 2:
-                item.setText(str(button.input_number or ""))
-            elif col == 4:
-                item.setText(str(button.output_number or ""))
-            elif col == 5:
-                item.setText(str(button.output_value))
-
-        # Save to temp file after each change
-        self.save_config(self.temp_config)
-        self.changes_made = True  # Mark changes made
-
-    def update_button_config(self, button):
-        try:
-            # Find the row for this button
-            row = None
-            for i, btn in enumerate(self.button_mappings.values()):
-                if btn == button:
-                    row = i
-                    break
-
-            if row is not None:
-                # Update input configuration
-                button.input_type = self.table.cellWidget(row, 1).currentText()
-                input_number = self.table.item(row, 2).text()
-                button.input_number = int(input_number) if input_number else None
-
-                # Update output configuration
-                button.output_type = self.table.cellWidget(row, 3).currentText()
-                output_number = self.table.item(row, 4).text()
-                button.output_number = int(output_number) if output_number else None
-
-                value = self.table.item(row, 5).text()
-                button.output_value = int(value) if value else 127
-
-                # Save configuration after each change
-                if self.main_window:
-                    self.main_window.save_config()
-        except ValueError:
-            pass  # Handle invalid number inputs
+    def shutdown(self):
+        """Stop MIDI, the servers and the recorder, once closing is confirmed"""
+        if self.control_server:
+            self.control_server.stop()
+        if self.osc_bridge:
+            self.osc_bridge.stop()
+        if self.midi_worker:
+            self.midi_worker.stop()
+        self.engine.stop()
+        print(f"Redundant MIDI sends saved: {self.engine.saved_sends}")
+        if self.recorder:
+            self.recorder.stop()
+            print(f"Recorded {self.recorder.events_written} events")
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -610,73 +653,63 @@ class MainWindow(QMainWindow):
         )
         learn_button.setCheckable(True)
         learn_button.clicked.connect(self.toggle_learn_mode)
-        main_layout.addWidget(learn_button)
         self.learn_button = learn_button
 
-        # Create grid layout for buttons
-        grid_widget = QWidget()
-        grid_layout = QGridLayout(grid_widget)
-        grid_layout.setSpacing(20)
-        grid_layout.setContentsMargins(20, 20, 20, 20)
-
-        # Define button colors
-        button_colors = [
-            "#FF5252",
-            "#FF4081",
-            "#7C4DFF",
-            "#448AFF",
-            "#64FFDA",
-            "#69F0AE",
-            "#FFEB3B",
-            "#FF9800",
-        ]
-
-        # Initialize ordered storage
-        self.buttons = {}
-        self.button_order = []
-
-        # Create buttons in a specific order
-        for i in range(8):
-            name = f"Button {i+1}"
-            row = i // 4  # 0 for first row (0-3), 1 for second row (4-7)
-            col = i % 4  # 0,1,2,3 for each row
-
-            button = CustomButton(name)
-            button.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-            button.setStyleSheet(
-                f"""
-                QPushButton {{
-                    background-color: {button_colors[i]};
-                    color: white;
-                    border: none;
-                    border-radius: 15px;
-                    font-size: 24px;
-                    font-weight: bold;
-                }}
-                QPushButton:pressed {{
-                    background-color: {button_colors[i]}99;
-                }}
+        # Undo button next to it, so a wrong edit on stage is one tap away
+        undo_button = QPushButton("Undo")
+        undo_button.setStyleSheet(
             """
-            )
-
-            button.clicked.connect(
-                lambda checked, btn=button: self.handle_button_click(btn)
-            )
-
-            # Store button in both dictionaries and order list
-            self.buttons[name] = button
-            self.button_order.append(name)
-
-            # Add to grid
-            grid_layout.addWidget(button, row, col)
-
-        # Make grid cells expand evenly
-        for i in range(2):
-            grid_layout.setRowStretch(i, 1)
-        for i in range(4):
-            grid_layout.setColumnStretch(i, 1)
+            QPushButton {
+                background-color: #607D8B;
+                color: white;
+                border: none;
+                padding: 15px;
+                border-radius: 5px;
+                font-size: 18px;
+                min-height: 50px;
+            }
+            QPushButton:disabled {
+                background-color: #37474F;
+                color: #90A4AE;
+            }
+        """
+        )
+        undo_button.setEnabled(False)
+        undo_button.clicked.connect(self.undo)
+        self.undo_button = undo_button
 
-        main_layout.addWidget(grid_widget)
+        # Name of the active bank, hidden with a single bank
+        self.bank_label = QLabel()
+        self.bank_label.setStyleSheet(
+            """
+            QLabel {
+                color: white;
+                background-color: #333;
+                padding: 15px;
+                border-radius: 5px;
+                font-size: 18px;
+                font-weight: bold;
+            }
+        """
+        )
+        self.bank_label.setAlignment(Qt.AlignCenter)
+        self.bank_label.hide()
+
+        top_layout = QHBoxLayout()
+        top_layout.addWidget(learn_button, 1)
+        top_layout.addWidget(self.bank_label)
+        top_layout.addWidget(undo_button)
+        main_layout.addLayout(top_layout)
+
+        # All pads are drawn by one custom painted widget
+        self.pad_grid = PadGrid(self.store.pads)
+        self.pad_grid.padClicked.connect(self.handle_button_click)
+        self.pad_grid.padTouched.connect(self.handle_button_click)
+        self.pad_grid.swiped.connect(self.engine.step_bank)
+        self.pad_grid.learnConfirmed.connect(self.finish_midi_learn)
+        self.pad_grid.learnCancelled.connect(self.cancel_midi_learn)
+        self.midiLearned.connect(self.pad_grid.set_learn_text)
+        main_layout.addWidget(self.pad_grid)
 
         # Add status label at the bottom
         self.status_label = QLabel("")
@@ -695,6 +728,125 @@ class MainWindow(QMainWindow):
         self.status_label.hide()
         main_layout.addWidget(self.status_label)
 
+    def update_pad_feedback(self):
+        """Repaint only the pads whose state changed since the last tick"""
+        triggered, values, latched = self.pad_sampler.sample()
+        now = time.monotonic()
+        for index in triggered:
+            self.pad_grid.set_flash(index, True)
+            self.flash_deadlines[index] = now + FLASH_DURATION
+        for index, value in values.items():
+            self.pad_grid.set_value(index, value)
+        for index, state in latched.items():
+            self.pad_grid.set_latched(index, state)
+
+        if self.flash_deadlines:
+            for index, deadline in list(self.flash_deadlines.items()):
+                if deadline <= now:
+                    self.pad_grid.set_flash(index, False)
+                    del self.flash_deadlines[index]
+
+    def midi_core(self):
+        """Core reserved for MIDI in real-time mode, the GUI gets the others"""
+        cores = available_cores()
+        core = self.options.midi_core
+        if core is None:
+            core = cores[-1]
+        # Keep the GUI thread and the threads it starts off the MIDI core
+        if len(cores) > 1:
+            pin_thread(set(cores) - {core})
+        return core
+
+    def start_midi_worker(self):
+        core = self.midi_core()
+        self.midi_worker = MidiWorker(core, self.options.fifo_priority)
+        self.midi_worker.start()
+        # Timed gestures fire on the detector's thread, their presses are
+        # sent from the worker like every other press
+        self.engine.gestures.fire = self.worker_press
+        print(
+            f"Real-time mode: MIDI worker on core {core}"
+            f"{' (pinned)' if self.midi_worker.pinned else ''}"
+            f"{', SCHED_FIFO' if self.midi_worker.fifo else ''}"
+        )
+
+    def worker_press(self, index):
+        self.midi_worker.put(self.engine.press, index)
+
+    def start_engine_process(self):
+        core = None
+        fifo_priority = 0
+        if self.options.realtime:
+            core = self.midi_core()
+            fifo_priority = self.options.fifo_priority
+        self.engine = EngineProcess(
+            self.store.pads,
+            fake_midi=self.options.fake_midi,
+            forward_input=self.recorder is not None,
+            core=core,
+            fifo_priority=fifo_priority,
+        )
+        self.engine.input_handler = self.handle_engine_input
+        self.engine.start()
+        self.pad_state = self.engine.state
+        print(
+            f"MIDI engine running in process {self.engine.process.pid}"
+            f"{f' on core {core}' if core is not None else ''}"
+        )
+
+    def check_resources(self):
+        for warning in self.resource_monitor.sample():
+            print(f"Resource monitor: {warning}")
+
+    def start_control_server(self):
+        self.sceneRequested.connect(self.load_scene)
+        self.control_server = ControlServer(
+            {
+                "press": self.control_press,
+                "send": self.control_send,
+                "scene": self.control_scene,
+            },
+            port=self.options.control_port,
+            socket_path=self.options.control_socket,
+        )
+        try:
+            self.control_server.start()
+        except OSError as e:
+            print(f"Could not start control server: {e}")
+            self.control_server = None
+
+    def control_press(self, pad):
+        """Press a pad given by index or name (control server thread)"""
+        names = self.store.bank(self.engine.bank)[0]
+        if isinstance(pad, str) and pad in names:
+            pad = names.index(pad)
+        if not isinstance(pad, int) or isinstance(pad, bool) or not (
+            0 <= pad < self.store.pads
+        ):
+            raise ValueError(f"no pad {pad!r}")
+        self.handle_button_press(pad)
+
+    def control_send(self, messages):
+        """Send raw MIDI messages (control server thread)"""
+        if not isinstance(messages, list):
+            raise ValueError("expected a list of MIDI messages (lists of bytes)")
+        # Held to the same standard as messages built from the config
+        for message in messages:
+            check_midi_message(message)
+        self.engine.send(messages)
+
+    def control_scene(self, name):
+        """Load configs/<name>.json (control server thread)"""
+        if not isinstance(name, str) or Path(name).name != name:
+            raise ValueError(f"invalid scene name {name!r}")
+        if not (self.config_dir / f"{name}.json").exists():
+            raise ValueError(f"no scene {name!r}")
+        # Loading touches widgets, so it has to happen on the GUI thread
+        self.sceneRequested.emit(name)
+
+    def load_scene(self, name):
+        self.load_config(self.config_dir / f"{name}.json")
+
     def toggle_learn_mode(self, checked):
         if checked:
             self.is_learn_mode = True
@@ -707,17 +859,17 @@ class MainWindow(QMainWindow):
             self.status_label.hide()
         return True
 
-    def handle_button_click(self, button):
+    def handle_button_click(self, index):
         if self.is_learn_mode:
-            # Enter MIDI learn mode for this button
-            if self.current_learning_button:
-                return  # Don't allow switching buttons while in learn mode
-            self.current_learning_button = button
-            button.showLearnMode()
+            # Enter MIDI learn mode for this pad
+            if self.current_learning_pad is not None:
+                return  # Don't allow switching pads while in learn mode
+            self.set_learning_pad(index)
+            self.pad_grid.show_learn(index)
             self.status_label.setText("Waiting for MIDI message...")
         else:
             # Normal button press handling
-            self.handle_button_press(button)
+            self.handle_button_press(index)
 
     def setup_menu(self):
         # Create main menu bar
@@ -759,6 +911,15 @@ class MainWindow(QMainWindow):
         load_action = self.config_menu.addAction("Load Configuration")
         load_action.triggered.connect(self.load_config_dialog)
 
+        # Edit menu (left)
+        edit_menu = menubar.addMenu("Edit")
+        undo_action = edit_menu.addAction("Undo")
+        undo_action.setShortcut(QKeySequence.Undo)
+        undo_action.triggered.connect(self.undo)
+        redo_action = edit_menu.addAction("Redo")
+        redo_action.setShortcut(QKeySequence.Redo)
+        redo_action.triggered.connect(self.redo)
+
         # Add menubar to layout
         top_layout.addWidget(menubar)
 
@@ -809,28 +970,6 @@ class MainWindow(QMainWindow):
 
             traceback.print_exc()  # Print full error traceback
 
-    def update_ui_from_config(self):
-        try:
-            print("Updating UI from config")  # Debug print
-
-            # Update button names and properties
-            for button in self.buttons.values():
-                button_name = button.text()
-                print(f"Updated button name to: {button_name}")  # Debug print
-
-                # Update button_order to match current button names
-                if button_name not in self.button_order:
-                    index = list(self.buttons.values()).index(button)
-                    if index < len(self.button_order):
-                        self.button_order[index] = button_name
-
-            print("UI update completed")  # Debug print
-        except Exception as e:
-            print(f"Error updating UI: {e}")
-            import traceback
-
-            traceback.print_exc()  # Print full error traceback
-
     def load_config(self, config_file=None):
         if config_file is None:
             config_file = self.config_file
@@ -841,49 +980,47 @@ class MainWindow(QMainWindow):
                 config_file = Path(config_file)
 
             if config_file.exists():
-                with open(config_file, "r") as f:
-                    config = json.load(f)
-                print(f"Loaded config: {config}")
+                # Validate everything up front and report all errors at once
+                try:
+                    compiled = load_config_file(config_file, self.config_cache)
+                except ConfigError as e:
+                    print(f"Invalid configuration {config_file}:\n{e}")
+                    QMessageBox.warning(
+                        self,
+                        "Invalid Configuration",
+                        f"{config_file.name} was not loaded:\n\n{e}",
+                    )
+                    return
+                print(
+                    "Loaded config: "
+                    + ", ".join(
+                        f"{bank['name']} {bank['names']}" for bank in compiled["banks"]
+                    )
+                )
 
                 # Set current config file
                 self.current_config = config_file
 
-                # Load button configurations
-                if "buttons" in config:
-                    # Get the list of button configurations in order
-                    button_configs = list(config["buttons"].items())
-
-                    # Update each button with its corresponding configuration
-                    for i, (button_name, button_config) in enumerate(button_configs):
-                        if i < len(self.button_order):
-                            old_name = self.button_order[i]
-                            button = self.buttons[old_name]
-
-                            # Update button properties
-                            button.setText(button_name)  # Update the visible text
-                            button.input_type = button_config.get("input_type", "note")
-                            button.input_number = button_config.get("input_number")
-                            button.output_type = button_config.get("output_type", "note")
-                            button.output_number = button_config.get("output_number")
-                            button.output_value = button_config.get("output_value", 127)
-                            if "midi_message" in button_config:
-                                button.midi_message = button_config["midi_message"]
-
-                            # Update mappings
-                            if old_name != button_name:
-                                self.buttons[button_name] = self.buttons.pop(old_name)
-                                self.button_order[i] = button_name
-
-                            print(f"Updated button {button_name} (was {old_name})")
-
-                # Load MIDI port configurations
-                if "midi_ports" in config:
-                    self.current_input_port = config["midi_ports"].get("input")
-                    self.current_output_port = config["midi_ports"].get("output")
-                    if self.current_input_port or self.current_output_port:
-                        self.connect_midi_devices(
-                            self.current_input_port, self.current_output_port
-                        )
+                # Replace the mappings and swap in the precompiled routing tables
+                self.store.load(compiled)
+                self.bank_select = compiled["bank_select"]
+                # Shows the first bank, relabeling the pads
+                self.engine.load(
+                    self.store.inputs,
+                    self.store.outputs,
+                    self.store.pads,
+                    compiled["bank_select_key"],
+                    self.store.gestures,
+                )
+
+                self.apply_settings(compiled)
+                self.watch_config()
+
+                # Journaled edits belong to the previous snapshot, the next
+                # ones go on top of a snapshot of this config
+                if config_file != self.temp_config:
+                    self.compact_journal()
+                self.update_undo_state()
 
                 # Update config label
                 self.update_config_label()
@@ -896,22 +1033,147 @@ class MainWindow(QMainWindow):
             import traceback
             traceback.print_exc()
 
+    def apply_settings(self, compiled):
+        """Apply the settings of a compiled config, skipping unchanged ones"""
+        if compiled["gesture_timing"] != self.gesture_timing:
+            self.gesture_timing = compiled["gesture_timing"]
+            self.engine.set_gesture_timing(
+                self.gesture_timing["double_tap_ms"],
+                self.gesture_timing["long_press_ms"],
+            )
+        if compiled["thru"] != self.thru_settings:
+            # Compiled once here, forwarding is a single function call
+            self.thru_settings = compiled["thru"]
+            self.engine.set_thru(
+                self.thru_settings["forward"], self.thru_settings["stages"]
+            )
+
+        # Load MIDI port configurations
+        ports = compiled["midi_ports"]
+        if ports["sysex_rate"] != self.sysex_rate:
+            self.sysex_rate = ports["sysex_rate"]
+            self.engine.set_sysex_rate(self.sysex_rate)
+        self.current_input_port = ports["input"]
+        self.current_output_port = ports["output"]
+        # Reopening ports that are already open would be a gap in the MIDI
+        if (ports["input"] or ports["output"]) and (
+            ports["input"],
+            ports["output"],
+        ) != self.connected_ports:
+            self.connect_midi_devices(ports["input"], ports["output"])
+        self.configure_osc(compiled["osc"])
+
+    def watch_config(self):
+        """Watch the current config file for external edits
+
+        The temp config is written by the app itself and isn't watched.
+        """
+        watched = self.config_watcher.files()
+        if watched:
+            self.config_watcher.removePaths(watched)
+        config_file = self.current_config
+        if config_file and config_file != self.temp_config and config_file.exists():
+            self.config_watcher.addPath(str(config_file))
+
+    def on_config_file_changed(self, path):
+        # Wait for the editor to finish writing
+        self.reload_timer.start()
+
+    def reload_config(self):
+        """Apply an externally edited config file
+
+        Only the buttons that differ are updated, the pads are not relabeled
+        and unchanged ports stay open. A config with a different number of
+        banks or another bank select is loaded in full.
+        """
+        config_file = self.current_config
+        if config_file is None or not config_file.exists():
+            return
+        # Editors that replace the file make the watcher drop it
+        self.watch_config()
+        start = time.perf_counter()
+        try:
+            compiled = load_config_file(config_file, self.config_cache)
+        except ConfigError as e:
+            # Likely still being edited, keep the running config
+            print(f"Not reloading invalid configuration {config_file}:\n{e}")
+            return
+        except OSError as e:
+            print(f"Could not reload {config_file}: {e}")
+            return
+        if compiled["bank_select"] != self.bank_select:
+            self.load_config(config_file)
+            return
+        changes_made = self.changes_made
+        deltas = self.store.reload(compiled)
+        if deltas is None:
+            self.load_config(config_file)
+            return
+        # Reloaded deltas are the file's content, not unsaved edits
+        self.changes_made = changes_made
+        if len(self.store.bank_names) > 1:
+            self.bank_label.setText(self.store.bank_names[self.engine.bank])
+        self.apply_settings(compiled)
+        # Later edits are journaled on top of the reloaded state
+        self.compact_journal()
+        self.update_undo_state()
+        elapsed = (time.perf_counter() - start) * 1000
+        if deltas:
+            print(
+                f"Reloaded {config_file.name}: {len(deltas)} change(s) "
+                f"in {elapsed:.1f} ms"
+            )
+
+    def show_bank(self, bank):
+        """Relabel the pads after a bank switch"""
+        names = self.store.bank(bank)[0]
+        for i, name in enumerate(names):
+            self.pad_grid.set_name(i, name)
+        if len(self.store.bank_names) > 1:
+            self.bank_label.setText(self.store.bank_names[bank])
+            self.bank_label.show()
+        else:
+            self.bank_label.hide()
+        if self.mappings_dialog is not None:
+            self.mappings_dialog.set_bank(bank)
+
     def show_midi_dialog(self):
         dialog = MIDIDeviceDialog(
+            self.midi_in,
+            self.midi_out,
             self,
             current_input=self.current_input_port,
             current_output=self.current_output_port,
         )
-        if dialog.exec():
+        accepted = dialog.exec()
+        input_port = dialog.input_combo.currentText()
+        output_port = dialog.output_combo.currentText()
+        # Parented to the window, so it has to be disposed explicitly
+        dialog.deleteLater()
+        if accepted:
             # Connect to selected devices
-            self.connect_midi_devices(
-                dialog.input_combo.currentText(), dialog.output_combo.currentText()
-            )
+            self.connect_midi_devices(input_port, output_port)
             # Store current selections
-            self.current_input_port = dialog.input_combo.currentText()
-            self.current_output_port = dialog.output_combo.currentText()
+            self.current_input_port = input_port
+            self.current_output_port = output_port
+            self.engine.set_ports(self.current_input_port, self.current_output_port)
 
     def connect_midi_devices(self, input_port, output_port):
+        if self.options.engine_process:
+            # The engine process opens the ports, ours only list them
+            self.connected_ports = (None, None)
+            if input_port and input_port in self.midi_in.get_ports():
+                self.current_input_port = input_port
+                self.connected_ports = (input_port, None)
+            if output_port and output_port in self.midi_out.get_ports():
+                self.current_output_port = output_port
+                self.connected_ports = (self.connected_ports[0], output_port)
+            self.engine.connect(input_port, output_port)
+            return
+
+        # Device state is only known while connected
+        self.engine.forget_device_state()
+
         # Close existing connections
         if self.midi_in.is_port_open():
             self.midi_in.close_port()
@@ -919,87 +1181,103 @@ class MainWindow(QMainWindow):
             self.midi_out.close_port()
 
         # Open new connections
-        if input_port:
-            input_ports = self.midi_in.get_ports()
-            if input_port in input_ports:
-                self.midi_in.open_port(input_ports.index(input_port))
-                self.midi_in.set_callback(self.handle_midi_input)
-                self.current_input_port = input_port
+        self.connected_ports = (None, None)
+        if input_port and open_port(self.midi_in, input_port):
+            self.midi_in.set_callback(self.handle_midi_input)
+            accept_system_messages(self.midi_in)
+            self.current_input_port = input_port
+            self.connected_ports = (input_port, None)
+
+        if output_port and open_port(self.midi_out, output_port):
+            self.current_output_port = output_port
+            self.connected_ports = (self.connected_ports[0], output_port)
+
+        self.engine.set_ports(self.current_input_port, self.current_output_port)
+
+    def configure_osc(self, settings):
+        """Start, restart or stop the OSC bridge for the loaded settings"""
+        if settings == self.osc_settings:
+            return  # Keep the sockets open
+        self.osc_settings = settings
+        if self.osc_bridge:
+            self.osc_bridge.stop()
+            self.osc_bridge = None
+            self.engine.osc_send = None
+        if settings["listen_port"] is None and settings["send_port"] is None:
+            return
+        bridge = OscBridge(self.handle_osc_input, **settings)
+        try:
+            bridge.start()
+        except OSError as e:
+            print(f"Could not start OSC: {e}")
+            bridge.stop()
+            return
+        self.osc_bridge = bridge
+        self.engine.osc_send = bridge.send
+
+    def handle_osc_input(self, address, args):
+        """Handle an OSC message (OSC listener thread)"""
+        if self.current_learning_pad is not None:
+            self.learned_message = ("osc", address, None)
+            self.midiLearned.emit(f"Received: OSC {address}\nClick OK to confirm")
+        else:
+            self.engine.handle_osc(address, args)
+
+    def learn_midi(self, message):
+        """Keep a message received in MIDI learn mode until the user confirms"""
+        if len(message) < 2:
+            return  # Clock, start/stop, ... can't be learned
+        status = message[0]
+        if status >= 0x90 and status <= 0x9F:  # Note On
+            input_type = "note"
+        elif status >= 0xB0 and status <= 0xBF:  # CC
+            input_type = "cc"
+        elif status >= 0xC0 and status <= 0xCF:  # Program Change
+            input_type = "pc"
+        else:
+            return
+        self.learned_message = (input_type, message[1], list(message))
 
-        if output_port:
-            output_ports = self.midi_out.get_ports()
-            if output_port in output_ports:
-                self.midi_out.open_port(output_ports.index(output_port))
-                self.current_output_port = output_port
+        # Update learn label with received message
+        self.midiLearned.emit(
+            f"Received: {input_type.upper()} {message[1]}\nClick OK to confirm"
+        )
+
+    def handle_engine_input(self, message):
+        """MIDI input forwarded by the engine process (event thread)"""
+        if self.current_learning_pad is not None:
+            self.learn_midi(message)
+        elif self.recorder is not None:
+            self.recorder.record_midi(message)
 
     def handle_midi_input(self, midi_message, time_stamp):
         message, delta_time = midi_message
-        if len(message) >= 2:  # All MIDI messages have at least 2 bytes
-            status = message[0]
-
-            if self.current_learning_button:
-                # Store the complete MIDI message
-                self.current_learning_button.midi_message = message
-
-                # MIDI Learn mode
-                if status >= 0x90 and status <= 0x9F:  # Note On
-                    self.current_learning_button.input_type = "note"
-                    self.current_learning_button.input_number = message[1]
-                elif status >= 0xB0 and status <= 0xBF:  # CC
-                    self.current_learning_button.input_type = "cc"
-                    self.current_learning_button.input_number = message[1]
-                elif status >= 0xC0 and status <= 0xCF:  # Program Change
-                    self.current_learning_button.input_type = "pc"
-                    self.current_learning_button.input_number = message[1]
-
-                # Update learn label with received message
-                msg_type = self.current_learning_button.input_type.upper()
-                msg_num = self.current_learning_button.input_number
-                self.current_learning_button.learn_label.setText(
-                    f"Received: {msg_type} {msg_num}\nClick OK to confirm"
-                )
-            else:
-                # Normal mode - find and trigger button with matching input
-                for button in self.buttons.values():
-                    if (
-                        button.input_type == "note"
-                        and status >= 0x90
-                        and status <= 0x9F
-                    ):
-                        if button.input_number == message[1]:
-                            self.handle_button_press(button)
-                    elif (
-                        button.input_type == "cc" and status >= 0xB0 and status <= 0xBF
-                    ):
-                        if button.input_number == message[1]:
-                            self.handle_button_press(button)
-                    elif (
-                        button.input_type == "pc" and status >= 0xC0 and status <= 0xCF
-                    ):
-                        if button.input_number == message[1]:
-                            self.handle_button_press(button)
-
-    def handle_button_press(self, button):
-        # Don't handle button press if we're in MIDI learn mode
-        if self.current_learning_button:
+        if not message:
             return
+        if self.current_learning_pad is not None:
+            self.learn_midi(message)
+        else:
+            # Normal mode - trigger the buttons indexed for this input.
+            # 1-byte messages (clock, start/stop) only go to MIDI thru.
+            if self.recorder is not None:
+                self.recorder.record_midi(message)
+            if self.midi_worker is not None:
+                self.midi_worker.put(self.engine.handle_input, message)
+            else:
+                self.engine.handle_input(message)
 
-        if not self.midi_out.isPortOpen() or button.output_number is None:
+    def handle_button_press(self, index):
+        # Don't handle button press if we're in MIDI learn mode
+        if self.current_learning_pad is not None:
             return
 
-        if button.output_type == "note":
-            # Note On
-            self.midi_out.send_message([0x90, button.output_number, 127])
-            # Note Off
-            self.midi_out.send_message([0x80, button.output_number, 0])
-        elif button.output_type == "cc":
-            # Control Change
-            self.midi_out.send_message(
-                [0xB0, button.output_number, button.output_value]
-            )
-        elif button.output_type == "pc":
-            # Program Change
-            self.midi_out.send_message([0xC0, button.output_number])
+        if self.recorder is not None:
+            self.recorder.record_press(index)
+        # Messages were validated and built when the config was compiled
+        if self.midi_worker is not None:
+            self.midi_worker.put(self.engine.press, index)
+        else:
+            self.engine.press(index)
 
     def keyPressEvent(self, event):
         # Handle Escape key to exit fullscreen
@@ -1008,90 +1286,131 @@ class MainWindow(QMainWindow):
 
     def show_mappings_dialog(self):
         try:
-            # Create an ordered dictionary based on button_order
-            ordered_mappings = {}
-            buttons_list = list(self.buttons.values())
-
-            # Always process 8 buttons
-            for i in range(8):
-                if i < len(buttons_list):
-                    button = buttons_list[i]
-                    ordered_mappings[button.text()] = button
-                else:
-                    # Create a default button for empty slots
-                    default_button = CustomButton(f"Button {i+1}")
-                    ordered_mappings[default_button.text()] = default_button
-                print(
-                    f"Adding button to mappings: {ordered_mappings[list(ordered_mappings.keys())[i]].text()}"
-                )  # Debug print
-
-            dialog = NoteMappingDialog(ordered_mappings, self)
-            dialog.exec()
+            # Reuse the open dialog instead of stacking a new one
+            if self.mappings_dialog is None:
+                self.mappings_dialog = NoteMappingDialog(self.store, self)
+                self.mappings_dialog.set_bank(self.engine.bank)
+                self.mappings_dialog.finished.connect(self.on_mappings_dialog_closed)
+            self.mappings_dialog.show()
+            self.mappings_dialog.raise_()
         except Exception as e:
             print(f"Error showing mappings dialog: {e}")
             import traceback
 
             traceback.print_exc()
 
-    def show_midi_learn(self, button, pos):
-        if self.current_learning_button:
-            self.current_learning_button.hideLearnMode()
-
-        self.current_learning_button = button
-        button.showLearnMode(pos)
-
-    def eventFilter(self, obj, event):
-        if isinstance(event, QMouseEvent):
-            if (
-                event.type() == QEvent.Type.MouseButtonPress
-                and self.current_learning_button
-            ):
-                # Check if click is outside the MIDI learn UI
-                if not self.is_click_inside_learn_ui(event.globalPosition().toPoint()):
-                    self.cancel_midi_learn(self.current_learning_button)
-                return True  # Consume the click event while in MIDI learn mode
-        return super().eventFilter(obj, event)
-
-    def finish_midi_learn(self, button):
-        if button == self.current_learning_button:
-            # Save the MIDI mapping here
-            self.save_config()  # Save the new configuration
+    def on_mappings_dialog_closed(self):
+        self.mappings_dialog.deleteLater()
+        self.mappings_dialog = None
+
+    def show_midi_learn(self, index):
+        if self.current_learning_pad is not None:
+            self.pad_grid.hide_learn()
+
+        self.set_learning_pad(index)
+        self.pad_grid.show_learn(index)
+
+    def finish_midi_learn(self, pad):
+        if pad == self.current_learning_pad:
+            # Apply the learned mapping, which journals it like any other edit
+            index = self.engine.bank * self.store.pads + pad
+            if self.learned_message:
+                input_type, source, message = self.learned_message
+                # OSC inputs are learned as their address
+                if input_type == "osc":
+                    source_field = "input_address"
+                else:
+                    source_field = "input_number"
+                # One learn is one undo step
+                with self.store.group():
+                    self.store.set_field(index, "input_type", input_type)
+                    self.store.set_field(index, source_field, source)
+                    self.store.set_field(index, "midi_message", message)
+            self.learned_message = None
 
             # Clean up the UI
-            button.hideLearnMode()
-            self.current_learning_button = None
+            self.pad_grid.hide_learn()
+            self.set_learning_pad(None)
             self.is_learn_mode = False
             self.learn_button.setChecked(False)
             self.status_label.hide()
 
+    def set_learning_pad(self, index):
+        """Start MIDI learn for a pad, or stop it with None"""
+        self.current_learning_pad = index
+        if self.options.engine_process:
+            # Input is forwarded to us instead of being routed while learning
+            self.engine.set_learning(index is not None)
+
     def cancel_midi_learn(self):
-        if self.current_learning_button:
-            self.current_learning_button.hideLearnMode()
-            self.current_learning_button = None
+        if self.current_learning_pad is not None:
+            self.pad_grid.hide_learn()
+            self.set_learning_pad(None)
+        self.learned_message = None
         self.is_learn_mode = False
         self.learn_button.setChecked(False)
         self.status_label.hide()
 
-    def is_click_inside_learn_ui(self, global_pos):
-        if not self.current_learning_button:
-            return False
-
-        button = self.current_learning_button
-
-        # Check if click is inside label or button
-        label_geo = button.learn_label.geometry()
-        buttons_geo = button.button_container.geometry()
-        label_global = button.mapToGlobal(label_geo.topLeft())
-        buttons_global = button.mapToGlobal(buttons_geo.topLeft())
-
-        label_rect = QRect(label_global, label_geo.size())
-        buttons_rect = QRect(buttons_global, buttons_geo.size())
 
-        return label_rect.contains(global_pos) or buttons_rect.contains(global_pos)
+def parse_args(argv=None):
+    """Parse our options, returning them and the arguments left for Qt"""
+    parser = argparse.ArgumentParser(description="Touch-Friendly MIDI Controller")
+    parser.add_argument(
+        "--fake-midi",
+        action="store_true",
+        help="use fake MIDI ports instead of python-rtmidi (no hardware needed)",
+    )
+    parser.add_argument(
+        "--control",
+        action="store_true",
+        help="start the local control server (Unix socket and TCP on 127.0.0.1)",
+    )
+    parser.add_argument("--control-port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--control-socket", default=str(DEFAULT_SOCKET))
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="append MIDI input and pad presses to FILE (replay with bench.py soak)",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="dispatch MIDI on a dedicated thread pinned to its own core",
+    )
+    parser.add_argument(
+        "--midi-core",
+        type=int,
+        help="core for the real-time MIDI worker (default: the last one)",
+    )
+    parser.add_argument(
+        "--fifo-priority",
+        type=int,
+        default=50,
+        help="SCHED_FIFO priority of the real-time MIDI worker, 0 to disable",
+    )
+    parser.add_argument(
+        "--engine-process",
+        action="store_true",
+        help="run the MIDI engine in its own process, unaffected by UI stalls",
+    )
+    parser.add_argument(
+        "--monitor-interval",
+        type=float,
+        default=60,
+        metavar="SECONDS",
+        help="how often to check for growing memory and object counts, 0 to disable",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="list the allocations that grew when the resource monitor warns",
+    )
+    return parser.parse_known_args(argv)
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    options, qt_args = parse_args()
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = MainWindow(options)
     window.show()
     sys.exit(app.exec())